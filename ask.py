@@ -6,17 +6,634 @@ ask.py – 日本語LLM（ELYZA）のCLIクライアント
 #.env の ELYZA_MODEL_PATH を優先的に読み込み、
 #–model オプションでパスを上書き可能
 #–stream でストリーミング出力対応
+#–jp-sentence で GBNF 文法により「日本語1文・句点終わり・規定長」に制約して生成
+#–cache（または LLM_CACHE=on）で、同じモデル・プロンプト・設定の応答を .cache/llm_cache.sqlite3 から返す
+#  （既定は –temp 0 のときだけ。サンプリング出力を TTL の間固定しないため）
+#–serve でモデルを常駐させる推論サーバを起動（localhost HTTP、1ワーカー＋キュー）
+#  サーバが起動していれば通常の `ask.py "質問"` はサーバへ投げ、モデルのロードを省く
+#–batch file.jsonl でモデルを1回だけロードして一括生成し、結果を JSONL で書き出す
+#  （–workers N でコアを N プロセスに分割、件ごとの遅延・tokens/s と全体スループットを表示）
+#–prompt-cache ram|disk で共通プレフィックスの KV 状態を保存・復元し、プロンプト評価を省く
+#–draft-model（小型 GGUF）/ –prompt-lookup N で投機的デコード（受理率と tokens/s を表示）
+#–threads / –threads-batch / –batch-size / –ctx / –mmap / –mlock でロード設定を調整
+#  （–probe でスレッド数ごとの tokens/s を計測）
 """
 
 import argparse
+import json
+import logging
 import os
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import weakref
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
 from dotenv import load_dotenv
-from llama_cpp import Llama
 import multiprocessing
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src"))
+from llm_cache import LLMCache, cache_key, cache_mode  # noqa: E402
+
+DEFAULT_SERVER = "http://127.0.0.1:8765"
+DEFAULT_PROMPT_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "llama_kv"
+INSTRUCT_HEAD = "### 指示\n"
+
+logger = logging.getLogger("ask")
+
+
+def jp_sentence_grammar(min_len: int, max_len: int) -> str:
+    """漢字・かな・カナと「、：」のみで、句点1つで終わる min_len〜max_len 文字の GBNF。"""
+    return (
+        f'root ::= char{{{min_len - 1},{max_len - 1}}} "。"\n'
+        'char ::= [\u4E00-\u9FFF\u3040-\u309F\u30A0-\u30FF、：]\n'
+    )
+
+
+def load_options(args) -> dict:
+    """CLI/環境変数から Llama のロード設定を組み立てる（0 は llama.cpp の既定）。"""
+    opts = {
+        "n_ctx": args.ctx,
+        "use_mmap": args.mmap,
+        "use_mlock": args.mlock,
+    }
+    if args.threads_batch:
+        opts["n_threads_batch"] = args.threads_batch
+    if args.batch_size:
+        opts["n_batch"] = args.batch_size
+    return opts
+
+
+def load_llm(model_path: str, n_threads: int | None = None, draft: dict | None = None, **opts):
+    """モデルをロードする（既定は CPU全コアを利用）。llama_cpp はここで初めて import する。
+
+    opts は Llama にそのまま渡す（n_ctx / n_threads_batch / n_batch / use_mmap / use_mlock）。
+    """
+    from llama_cpp import Llama
+    extra = {"n_ctx": 1024, **opts}
+    t0 = time.perf_counter()
+    llm = Llama(
+        model_path=model_path,
+        n_threads=n_threads or multiprocessing.cpu_count(),
+        verbose=False,
+        **extra
+    )
+    logger.debug("ロード %.2fs（n_threads=%s %s）", time.perf_counter() - t0,
+                 n_threads or multiprocessing.cpu_count(), extra)
+    # 下書きモデルは本体と同じロード設定で、文脈長は本体の実際の n_ctx に揃える
+    llm.draft_model = make_draft(draft, n_threads, **{**extra, "n_ctx": llm.n_ctx()})
+    return llm
+
+
+def probe_threads(model_path: str, candidates: list[int], inj_prompt: str,
+                  max_tokens: int, opts: dict) -> None:
+    """スレッド数ごとにロードして同じプロンプトを貪欲生成し、tokens/s を並べる。"""
+    rows = []
+    for n in candidates:
+        t0 = time.perf_counter()
+        llm = load_llm(model_path, n, **{**opts, "n_threads_batch": opts.get("n_threads_batch") or n})
+        load_sec = time.perf_counter() - t0
+        run_llm(llm, inj_prompt, 4, 0.0)  # 1回目の初期化コストを除く
+        t0 = time.perf_counter()
+        _, tokens = run_llm(llm, inj_prompt, max_tokens, 0.0)
+        elapsed = time.perf_counter() - t0
+        rows.append((n, load_sec, tokens, elapsed, tokens / elapsed if elapsed else 0.0))
+        print(f"[probe] threads={n:3d} load={load_sec:6.2f}s {tokens:4d} tok {elapsed:6.2f}s "
+              f"{rows[-1][4]:7.1f} tok/s", file=sys.stderr)
+        del llm
+    best = max(rows, key=lambda r: r[4])
+    print(f"[probe] 最速: threads={best[0]}（{best[4]:.1f} tok/s）→ ASK_THREADS={best[0]}", file=sys.stderr)
+
+
+def _probe_candidates(spec: str) -> list[int]:
+    if spec:
+        return [int(x) for x in spec.split(",") if x.strip()]
+    cpus = multiprocessing.cpu_count()
+    cands = {1, 2, cpus // 2, cpus}
+    cands.update(range(4, cpus, 4))
+    return sorted(c for c in cands if 1 <= c <= cpus)
+
+
+# ─────────── 投機的デコード ─────────── #
+class SmallModelDraft:
+    """小型 GGUF で貪欲に k トークン先読みする下書きモデル（LlamaDraftModel 互換）。
+
+    前回の入力と共通する部分の KV は残し、差分だけを評価する。
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int = 8, n_threads: int | None = None, **opts):
+        from llama_cpp import Llama
+        self.llm = Llama(
+            model_path=model_path,
+            n_threads=n_threads or multiprocessing.cpu_count(),
+            verbose=False,
+            **{"n_ctx": 1024, **opts}
+        )
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, /, **kwargs):
+        import numpy as np
+        ids = input_ids.tolist()
+        keep = min(_common_prefix(self.llm.input_ids[: self.llm.n_tokens].tolist(), ids), len(ids) - 1)
+        self.llm.n_tokens = keep
+        self.llm.eval(ids[keep:])
+        out = []
+        for _ in range(self.num_pred_tokens):
+            tok = self.llm.sample(top_k=1, temp=0.0)
+            if tok == self.llm.token_eos():
+                break
+            out.append(tok)
+            self.llm.eval([tok])
+        return np.array(out, dtype=np.intc)
+
+
+class CountingDraft:
+    """下書きモデルを包み、呼び出し回数と提案トークン数を数える。
+
+    1回の検証で「受理数 + 1」トークンが確定するので、受理数 ≈ 生成トークン数 − 呼び出し回数。
+    """
+
+    def __init__(self, inner, label: str):
+        self.inner = inner
+        self.label = label
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.proposed = 0
+
+    def __call__(self, input_ids, /, **kwargs):
+        out = self.inner(input_ids, **kwargs)
+        self.calls += 1
+        self.proposed += len(out)
+        return out
+
+    def acceptance(self, generated_tokens: int) -> float:
+        accepted = max(0, generated_tokens - self.calls)
+        return min(1.0, accepted / self.proposed) if self.proposed else 0.0
+
+
+def make_draft(spec: dict | None, n_threads: int | None = None, **opts) -> CountingDraft | None:
+    """spec = {"model": 下書き GGUF, "k": 先読み数, "lookup": N} から下書きモデルを作る。
+
+    opts は小型 GGUF のロード設定（load_llm と同じ n_ctx / n_batch / use_mmap など）。
+    """
+    if not spec or not (spec.get("model") or spec.get("lookup")):
+        return None
+    if spec.get("model"):
+        return CountingDraft(SmallModelDraft(spec["model"], spec.get("k", 8), n_threads, **opts),
+                             f"draft={Path(spec['model']).name}")
+    from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+    return CountingDraft(LlamaPromptLookupDecoding(num_pred_tokens=spec["lookup"]),
+                         f"prompt-lookup={spec['lookup']}")
+
+
+def instruct(prompt: str) -> str:
+    """Instruct フォーマットを付与する。"""
+    return f"{INSTRUCT_HEAD}{prompt}\n### 応答\n"
+
+
+# ─────────── プレフィックス KV キャッシュ ─────────── #
+def _common_prefix(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class PromptCache:
+    """llama-cpp の状態キャッシュ（LlamaRAMCache / LlamaDiskCache）を包み、命中を数える。
+
+    Llama は生成前に「プロンプトの最長プレフィックス」に一致する状態を引き、それが いま KV に
+    載っているプレフィックスより長いときだけ復元する（生成後に状態を保存する）。命中・復元
+    トークン数はこの実際に復元された場合だけ数え、KV が既に覆っていた場合は covered とする。
+    attach() で共通プレフィックスだけを評価した状態を先に入れておく。モデルへの参照は弱参照なので、
+    ModelWorker がアイドルでモデルを手放せばキャッシュが残っていても解放される。
+    """
+
+    def __init__(self, kind: str, cache_dir: Path, capacity_mb: int, warm_prefix: str = ""):
+        from llama_cpp import LlamaRAMCache, LlamaDiskCache
+        capacity = capacity_mb * 1024 * 1024
+        if kind == "disk":
+            try:
+                self.inner = LlamaDiskCache(cache_dir=str(cache_dir), capacity_bytes=capacity)
+            except ImportError as e:
+                raise SystemExit("--prompt-cache disk には diskcache が必要です（pip install diskcache）") from e
+        else:
+            self.inner = LlamaRAMCache(capacity_bytes=capacity)
+        self.kind = kind
+        self.cache_dir = Path(cache_dir)
+        self.warm_prefix = warm_prefix
+        self._llm_ref = None
+        self.hits = 0
+        self.misses = 0
+        self.covered = 0
+        self.restored_tokens = 0
+        self.sec_per_token = 0.0
+
+    @property
+    def llm(self):
+        return self._llm_ref() if self._llm_ref is not None else None
+
+    @property
+    def cache_size(self) -> int:
+        return self.inner.cache_size
+
+    @property
+    def capacity_bytes(self) -> int:
+        return self.inner.capacity_bytes
+
+    def __getitem__(self, key):
+        try:
+            state = self.inner[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        key = list(key)
+        cached = _common_prefix(state.input_ids.tolist(), key)
+        llm = self.llm
+        live = _common_prefix(llm._input_ids.tolist(), key) if llm is not None else 0
+        if cached > live:
+            self.hits += 1
+            self.restored_tokens += cached - live
+        else:
+            self.covered += 1
+        return state
+
+    def __contains__(self, key) -> bool:
+        return key in self.inner
+
+    def __setitem__(self, key, value) -> None:
+        self.inner[key] = value
+
+    def _rate_file(self) -> Path:
+        return self.cache_dir / "prompt_eval_rate.json"
+
+    def attach(self, llm, model_path: str) -> None:
+        """llm にキャッシュを設定し、共通プレフィックスを評価済みの状態で登録する。"""
+        llm.set_cache(self)
+        self._llm_ref = weakref.ref(llm)
+        tokens = llm.tokenize((INSTRUCT_HEAD + self.warm_prefix).encode("utf-8"))
+        rates = {}
+        if self.kind == "disk":
+            try:
+                rates = json.loads(self._rate_file().read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                pass
+        try:
+            state = self.inner[tokens]
+            if _common_prefix(state.input_ids.tolist(), tokens) >= len(tokens):
+                self.sec_per_token = rates.get(model_path, 0.0)
+                logger.debug("プレフィックス %d tok はキャッシュ済み", len(tokens))
+                return
+        except KeyError:
+            pass
+        llm.reset()
+        t0 = time.perf_counter()
+        llm.eval(tokens)
+        elapsed = time.perf_counter() - t0
+        self.inner[tokens] = llm.save_state()
+        self.sec_per_token = elapsed / len(tokens)
+        logger.debug("プレフィックス %d tok を評価して保存（%.2fs）", len(tokens), elapsed)
+        if self.kind == "disk":
+            rates[model_path] = self.sec_per_token
+            self._rate_file().write_text(json.dumps(rates), encoding="utf-8")
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "hits": self.hits,
+            "misses": self.misses,
+            "covered": self.covered,
+            "restored_tokens": self.restored_tokens,
+            "saved_sec": round(self.restored_tokens * self.sec_per_token, 3),
+        }
+
+    def summary(self) -> str:
+        st = self.stats()
+        return (f"prompt-cache({st['kind']}): hit={st['hits']} miss={st['misses']} "
+                f"covered={st['covered']} restored={st['restored_tokens']} tok prompt-eval 節約≈{st['saved_sec']:.2f}s")
+
+
+def make_prompt_cache(spec: dict | None) -> PromptCache | None:
+    """spec = {"kind": "ram"|"disk"|"off", "dir", "mb", "warm"} からキャッシュを作る。"""
+    if not spec or spec.get("kind", "off") == "off":
+        return None
+    return PromptCache(spec["kind"], Path(spec.get("dir") or DEFAULT_PROMPT_CACHE_DIR),
+                       int(spec.get("mb", 1024)), spec.get("warm", ""))
+
+
+def run_llm(llm, inj_prompt: str, max_tokens: int, temperature: float,
+            grammar_text: str = "", on_text=None) -> tuple[str, int]:
+    """1件生成して (本文, 生成トークン数) を返す。on_text を渡すとストリーミングで断片ごとに呼ぶ。"""
+    grammar = None
+    if grammar_text:
+        from llama_cpp import LlamaGrammar
+        grammar = LlamaGrammar.from_string(grammar_text, verbose=False)
+
+    if on_text:
+        pieces = []
+        for chunk in llm(
+            inj_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            grammar=grammar,
+            stream=True
+        ):
+            pieces.append(chunk["choices"][0]["text"])
+            on_text(pieces[-1])
+        return "".join(pieces).strip(), len(pieces)
+    res = llm(
+        inj_prompt,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        grammar=grammar
+    )
+    return res["choices"][0]["text"].strip(), res.get("usage", {}).get("completion_tokens", 0)
+
+
+# ─────────── バッチ ─────────── #
+def read_batch(path: str, field: str):
+    """JSONL を1行ずつ読み、(id, prompt) を返す。行が文字列ならそのまま prompt とする。"""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if isinstance(obj, str):
+                yield str(lineno), obj
+                continue
+            if field not in obj:
+                logger.warning("%s:%d に %r がありません（スキップ）", path, lineno, field)
+                continue
+            yield str(obj.get("id") or obj.get("request_id") or lineno), obj[field]
+
+
+_batch_llm = None
+_batch_params: dict = {}
+
+
+_batch_cache: PromptCache | None = None
+
+
+def _batch_init(model_path: str, n_threads: int, params: dict) -> None:
+    global _batch_llm, _batch_params, _batch_cache
+    _batch_llm = load_llm(model_path, n_threads, params.get("draft"), **params.get("load", {}))
+    _batch_params = params
+    _batch_cache = make_prompt_cache(params.get("prompt_cache"))
+    if _batch_cache:
+        _batch_cache.attach(_batch_llm, os.path.abspath(model_path))
+
+
+def _batch_generate(item: tuple[str, str]) -> dict:
+    item_id, prompt = item
+    before = _batch_cache.stats() if _batch_cache else None
+    draft = _batch_llm.draft_model
+    if draft:
+        draft.reset()
+    t0 = time.perf_counter()
+    try:
+        text, tokens = run_llm(_batch_llm, instruct(prompt), _batch_params["max_tokens"],
+                               _batch_params["temperature"], _batch_params["grammar"])
+    except Exception as e:
+        return {"id": item_id, "error": str(e), "latency_sec": round(time.perf_counter() - t0, 3)}
+    elapsed = time.perf_counter() - t0
+    rec = {
+        "id": item_id,
+        "text": text,
+        "tokens": tokens,
+        "latency_sec": round(elapsed, 3),
+        "tokens_per_sec": round(tokens / elapsed, 2) if elapsed else 0.0,
+    }
+    if before:
+        after = _batch_cache.stats()
+        rec["prefix_tokens_restored"] = after["restored_tokens"] - before["restored_tokens"]
+        rec["prompt_eval_saved_sec"] = round(after["saved_sec"] - before["saved_sec"], 3)
+    if draft:
+        rec["draft_acceptance"] = round(draft.acceptance(tokens), 3)
+    return rec
+
+
+def run_batch(model_path: str, batch_path: str, field: str, out, workers: int, params: dict) -> None:
+    """バッチ生成。結果は完了順に out へ1行ずつ書き、最後に集計を標準エラーへ出す。"""
+    workers = max(1, workers)
+    n_threads = max(1, (params.get("threads") or multiprocessing.cpu_count()) // workers)
+    items = read_batch(batch_path, field)
+    t_load = time.perf_counter()
+    if workers == 1:
+        _batch_init(model_path, n_threads, params)
+        pool = None
+        results = map(_batch_generate, items)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_batch_init,
+                                    initargs=(model_path, n_threads, params))
+        results = pool.imap_unordered(_batch_generate, items)
+    logger.info("バッチ開始: workers=%d n_threads=%d/worker", workers, n_threads)
+
+    latencies: list[float] = []
+    tokens = errors = restored = 0
+    saved = 0.0
+    t0 = time.perf_counter()
+    try:
+        for rec in results:
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+            latencies.append(rec["latency_sec"])
+            if "error" in rec:
+                errors += 1
+                logger.warning("[%s] 失敗: %s", rec["id"], rec["error"])
+                continue
+            tokens += rec["tokens"]
+            restored += rec.get("prefix_tokens_restored", 0)
+            saved += rec.get("prompt_eval_saved_sec", 0.0)
+            logger.info("[%s] %.2fs %d tok %.1f tok/s", rec["id"], rec["latency_sec"],
+                        rec["tokens"], rec["tokens_per_sec"])
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    wall = time.perf_counter() - t0
+    if not latencies:
+        logger.warning("バッチに対象行がありませんでした")
+        return
+    latencies.sort()
+    logger.info(
+        "[batch] items=%d errors=%d wall=%.2fs（ロード込み %.2fs） throughput=%.2f items/s %.1f tok/s "
+        "latency p50=%.2fs p95=%.2fs max=%.2fs",
+        len(latencies), errors, wall, time.perf_counter() - t_load, len(latencies) / wall,
+        tokens / wall, latencies[len(latencies) // 2],
+        latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], latencies[-1],
+    )
+    if params.get("prompt_cache", {}).get("kind", "off") != "off":
+        logger.info("[batch] prompt-cache: restored=%d tok prompt-eval 節約≈%.2fs", restored, saved)
+
+
+def compare_baseline(llm, inj_prompt: str, max_tokens: int, temperature: float, grammar_text: str) -> None:
+    """下書きモデルを外した場合と付けた場合で同じプロンプトを生成し、速度を比べる。"""
+    spec = llm.draft_model
+    rows = []
+    for label, draft in (("baseline", None), (spec.label, spec)):
+        llm.draft_model = draft
+        llm.reset()
+        if draft:
+            draft.reset()
+        t0 = time.perf_counter()
+        _, tokens = run_llm(llm, inj_prompt, max_tokens, temperature, grammar_text)
+        elapsed = time.perf_counter() - t0
+        rows.append((label, tokens, elapsed, draft.acceptance(tokens) if draft else None))
+    llm.draft_model = spec
+    base_tps = rows[0][1] / rows[0][2] if rows[0][2] else 0.0
+    for label, tokens, elapsed, acc in rows:
+        tps = tokens / elapsed if elapsed else 0.0
+        print(f"[compare] {label:<24} {tokens:4d} tok {elapsed:6.2f}s {tps:7.1f} tok/s"
+              f" x{tps / base_tps if base_tps else 0:.2f}"
+              + (f" 受理率≈{100 * acc:.0f}%" if acc is not None else ""), file=sys.stderr)
+
+
+# ─────────── 常駐サーバ ─────────── #
+class ModelWorker(threading.Thread):
+    """キューから1件ずつ取り出して生成する。Llama はこのスレッドだけが触る。
+
+    idle_timeout 秒リクエストが無ければモデルを解放し、次のリクエストで再ロードする。
+    """
+
+    def __init__(self, model_path: str, idle_timeout: float, prompt_cache: dict | None = None,
+                 draft: dict | None = None, threads: int = 0, load: dict | None = None):
+        super().__init__(name="ask-worker", daemon=True)
+        self.model_path = os.path.abspath(model_path)
+        self.idle_timeout = idle_timeout
+        self.draft = draft
+        self.threads = threads
+        self.load = load or {}
+        self.jobs: "queue.Queue[tuple[dict, Future]]" = queue.Queue()
+        self.llm = None
+        # モデルを解放してもキャッシュ（同じモデルの状態）は保持し、再ロード後に使い回す
+        self.cache = make_prompt_cache(prompt_cache)
+
+    def submit(self, params: dict) -> Future:
+        fut: Future = Future()
+        self.jobs.put((params, fut))
+        return fut
+
+    def _ensure_loaded(self) -> float:
+        if self.llm is not None:
+            return 0.0
+        t0 = time.perf_counter()
+        self.llm = load_llm(self.model_path, self.threads, self.draft, **self.load)
+        if self.cache:
+            self.cache.attach(self.llm, self.model_path)
+        elapsed = time.perf_counter() - t0
+        logger.info("モデルをロードしました: %s（%.2fs）", self.model_path, elapsed)
+        return elapsed
+
+    def run(self) -> None:
+        while True:
+            try:
+                params, fut = self.jobs.get(timeout=self.idle_timeout or None)
+            except queue.Empty:
+                if self.llm is not None:
+                    self.llm = None
+                    logger.info("%.0fs 無操作のためモデルを解放しました", self.idle_timeout)
+                continue
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                load_sec = self._ensure_loaded()
+                t0 = time.perf_counter()
+                text, tokens = run_llm(self.llm, params["prompt"], params["max_tokens"],
+                                       params["temperature"], params.get("grammar", ""))
+                fut.set_result({"text": text, "tokens": tokens, "load_sec": load_sec,
+                                "gen_sec": time.perf_counter() - t0})
+                if self.cache:
+                    logger.debug("%s", self.cache.summary())
+            except Exception as e:
+                fut.set_exception(e)
+
+
+def make_handler(worker: ModelWorker):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._reply(404, {"error": "not found"})
+            self._reply(200, {"model": worker.model_path, "loaded": worker.llm is not None,
+                              "queued": worker.jobs.qsize(),
+                              "prompt_cache": worker.cache.stats() if worker.cache else None})
+
+        def do_POST(self):
+            if self.path != "/generate":
+                return self._reply(404, {"error": "not found"})
+            try:
+                params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError:
+                return self._reply(400, {"error": "invalid json"})
+            if params.get("model") and os.path.abspath(params["model"]) != worker.model_path:
+                return self._reply(409, {"error": f"server model is {worker.model_path}"})
+            try:
+                self._reply(200, worker.submit(params).result())
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+
+        def log_message(self, fmt, *a):
+            logger.debug(fmt, *a)
+
+    return Handler
+
+
+def serve(model_path: str, server_url: str, idle_timeout: float, prompt_cache: dict | None = None,
+          draft: dict | None = None, threads: int = 0, load: dict | None = None) -> None:
+    url = urlparse(server_url)
+    worker = ModelWorker(model_path, idle_timeout, prompt_cache, draft, threads, load)
+    worker._ensure_loaded()
+    worker.start()
+    httpd = ThreadingHTTPServer((url.hostname or "127.0.0.1", url.port or 8765), make_handler(worker))
+    logger.info("推論サーバを起動しました: %s（idle-timeout=%ss）", server_url, idle_timeout or "なし")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def ask_server(server_url: str, params: dict) -> dict | None:
+    """サーバに生成を依頼する。サーバ不在・モデル不一致なら None（ローカル実行へ）。"""
+    req = urllib.request.Request(
+        server_url.rstrip("/") + "/generate",
+        data=json.dumps(params, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=600) as r:
+            return json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        if e.code == 409:
+            print(f"[ask] {json.loads(e.read()).get('error')} → ローカルで実行します", file=sys.stderr)
+            return None
+        raise SystemExit(f"[ask] サーバエラー {e.code}: {e.read().decode('utf-8', 'replace')}")
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
 def main():
     # .env から環境変数をロード
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
     # 引数定義
     default_model = os.getenv(
@@ -33,6 +650,7 @@ def main():
     )
     parser.add_argument(
         "prompt",
+        nargs="?",
         help="日本語で質問を入力"
     )
     parser.add_argument(
@@ -50,38 +668,265 @@ def main():
     parser.add_argument(
         "--stream",
         action="store_true",
-        help="ストリーミングモードで逐次出力"
+        help="ストリーミングモードで逐次出力（サーバ経由時はまとめて出力）"
+    )
+    parser.add_argument(
+        "--grammar-file",
+        help="GBNF 文法ファイルで出力を制約"
+    )
+    parser.add_argument(
+        "--jp-sentence",
+        action="store_true",
+        help="日本語1文（句点終わり・--min-len〜--max-len 文字）に制約"
+    )
+    parser.add_argument("--min-len", type=int, default=28, help="--jp-sentence の最小文字数")
+    parser.add_argument("--max-len", type=int, default=70, help="--jp-sentence の最大文字数")
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="応答キャッシュを使う（--no-cache で使わない）。"
+             "未指定時は LLM_CACHE=on なら使用、auto なら --temp 0 のときだけ使用"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="モデルを常駐させた推論サーバを --server のアドレスで起動"
+    )
+    parser.add_argument(
+        "--server",
+        default=os.getenv("ASK_SERVER", DEFAULT_SERVER),
+        help=f"推論サーバの URL（.env の ASK_SERVER、既定 {DEFAULT_SERVER}）"
+    )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="サーバを使わず、このプロセスでモデルをロードして生成"
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=float(os.getenv("ASK_IDLE_TIMEOUT", "600")),
+        help="--serve で無操作がこの秒数続いたらモデルを解放（0 で解放しない）"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE.jsonl",
+        help="JSONL の各行（--field の値、または文字列）を一括生成して JSONL で出力"
+    )
+    parser.add_argument(
+        "--field",
+        default="prompt",
+        help="--batch でプロンプトとして使うキー"
+    )
+    parser.add_argument(
+        "--output",
+        help="--batch の出力先（既定は標準出力）"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="--batch のワーカープロセス数（n_threads を均等に分割）"
+    )
+    parser.add_argument(
+        "--prompt-cache",
+        choices=("ram", "disk", "off"),
+        default=os.getenv("ASK_PROMPT_CACHE", "off"),
+        help="共通プレフィックスの KV 状態キャッシュ（.env の ASK_PROMPT_CACHE、既定 off）"
+    )
+    parser.add_argument(
+        "--prompt-cache-dir",
+        default=os.getenv("ASK_PROMPT_CACHE_DIR", str(DEFAULT_PROMPT_CACHE_DIR)),
+        help="--prompt-cache disk の保存先"
+    )
+    parser.add_argument(
+        "--prompt-cache-mb",
+        type=int,
+        default=int(os.getenv("ASK_PROMPT_CACHE_MB", "1024")),
+        help="KV キャッシュの上限（MB）"
+    )
+    parser.add_argument(
+        "--warm-prefix-file",
+        help="全プロンプトに共通する先頭部分（指示文など）。起動時に評価してキャッシュに入れる"
+    )
+    parser.add_argument(
+        "--draft-model",
+        default=os.getenv("ASK_DRAFT_MODEL", ""),
+        help="投機的デコードに使う小型 GGUF（同じ語彙のモデル。.env の ASK_DRAFT_MODEL）"
+    )
+    parser.add_argument(
+        "--draft-tokens",
+        type=int,
+        default=8,
+        help="--draft-model が1回に先読みするトークン数"
+    )
+    parser.add_argument(
+        "--prompt-lookup",
+        type=int,
+        default=int(os.getenv("ASK_PROMPT_LOOKUP", "0")),
+        metavar="N",
+        help="プロンプト内の n-gram から N トークンを先読み（0 で無効、--draft-model が優先）"
+    )
+    parser.add_argument(
+        "--compare-baseline",
+        action="store_true",
+        help="下書き無しでも同じプロンプトを生成し、tokens/s を並べて表示"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=int(os.getenv("ASK_THREADS", "0")),
+        help="生成スレッド数（.env の ASK_THREADS、0 で論理コア数）"
+    )
+    parser.add_argument(
+        "--threads-batch",
+        type=int,
+        default=int(os.getenv("ASK_THREADS_BATCH", "0")),
+        help="プロンプト評価のスレッド数（0 で llama.cpp の既定）"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=int(os.getenv("ASK_BATCH_SIZE", "0")),
+        help="プロンプト評価のバッチサイズ n_batch（0 で llama.cpp の既定）"
+    )
+    parser.add_argument(
+        "--ctx",
+        type=int,
+        default=int(os.getenv("ASK_CTX", "1024")),
+        help="コンテキスト長 n_ctx"
+    )
+    parser.add_argument(
+        "--mmap",
+        action=argparse.BooleanOptionalAction,
+        default=os.getenv("ASK_MMAP", "1") == "1",
+        help="モデルを mmap で読む（--no-mmap で一括読み込み）"
+    )
+    parser.add_argument(
+        "--mlock",
+        action=argparse.BooleanOptionalAction,
+        default=os.getenv("ASK_MLOCK", "0") == "1",
+        help="モデルをメモリにロックしてページアウトを防ぐ"
+    )
+    parser.add_argument(
+        "--probe",
+        nargs="?",
+        const="",
+        metavar="N,N,...",
+        help="スレッド数ごとの tokens/s を計測して終了（省略時は 1〜論理コア数から選ぶ）"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="KV キャッシュの命中数・節約時間などを表示"
     )
     args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
 
-    # モデルロード（CPU全コアを利用）
-    llm = Llama(
-        model_path=args.model,
-        n_ctx=1024,
-        n_threads=multiprocessing.cpu_count(),
-        verbose=False
-    )
+    warm = ""
+    if args.warm_prefix_file:
+        warm = Path(args.warm_prefix_file).read_text(encoding="utf-8").rstrip("\n")
+    prompt_cache = {
+        "kind": args.prompt_cache,
+        "dir": args.prompt_cache_dir,
+        "mb": args.prompt_cache_mb,
+        "warm": warm,
+    }
+
+    draft = {"model": args.draft_model, "k": args.draft_tokens, "lookup": args.prompt_lookup}
+    load = load_options(args)
+
+    if args.probe is not None:
+        probe_threads(args.model, _probe_candidates(args.probe),
+                      instruct(args.prompt or "クレドについて一文で説明してください。"),
+                      args.max_tokens, load)
+        return
+    if args.serve:
+        serve(args.model, args.server, args.idle_timeout, prompt_cache, draft, args.threads, load)
+        return
+    if not (args.prompt or args.batch):
+        parser.error("prompt を指定してください（--serve / --batch 以外）")
+
+    grammar_text = ""
+    if args.grammar_file:
+        grammar_text = Path(args.grammar_file).read_text(encoding="utf-8")
+    elif args.jp_sentence:
+        grammar_text = jp_sentence_grammar(args.min_len, args.max_len)
+
+    if args.batch:
+        params = {"max_tokens": args.max_tokens, "temperature": args.temp, "grammar": grammar_text,
+                  "prompt_cache": prompt_cache, "draft": draft,
+                  "threads": args.threads, "load": load}
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            run_batch(args.model, args.batch, args.field, out, args.workers, params)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return
 
     # Instruct フォーマットを付与
-    inj_prompt = f"### 指示\n{args.prompt}\n### 応答\n"
+    inj_prompt = instruct(args.prompt)
 
-    # 実行 & 出力
-    if args.stream:
-        for chunk in llm(
-            inj_prompt,
-            max_tokens=args.max_tokens,
-            temperature=args.temp,
-            stream=True
-        ):
-            print(chunk["choices"][0]["text"], end="", flush=True)
-        print()
+    # 応答キャッシュ（命中すればモデルのロードも省く）
+    use_cache = args.cache
+    if use_cache is None:
+        mode = cache_mode()
+        use_cache = mode == "on" or (mode == "auto" and args.temp == 0)
+    cache = LLMCache() if use_cache else None
+    model_id = os.path.abspath(args.model)
+    key = cache_key(model_id, inj_prompt, {
+        "max_tokens": args.max_tokens,
+        "temperature": args.temp,
+        "grammar": grammar_text,
+    })
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+        print(cached)
+        return
+
+    # 常駐サーバがあればそちらで生成
+    res = None if args.local or args.compare_baseline else ask_server(args.server, {
+        "model": model_id,
+        "prompt": inj_prompt,
+        "max_tokens": args.max_tokens,
+        "temperature": args.temp,
+        "grammar": grammar_text,
+    })
+    if res is not None:
+        text = res["text"]
+        print(text)
     else:
-        res = llm(
-            inj_prompt,
-            max_tokens=args.max_tokens,
-            temperature=args.temp
-        )
-        print(res["choices"][0]["text"].strip())
+        # 実行 & 出力
+        llm = load_llm(args.model, args.threads, draft, **load)
+        cache_kv = make_prompt_cache(prompt_cache)
+        if cache_kv:
+            cache_kv.attach(llm, model_id)
+        spec = llm.draft_model
+        if spec and args.compare_baseline:
+            compare_baseline(llm, inj_prompt, args.max_tokens, args.temp, grammar_text)
+        if spec:
+            spec.reset()
+        t0 = time.perf_counter()
+        if args.stream:
+            text, tokens = run_llm(llm, inj_prompt, args.max_tokens, args.temp, grammar_text,
+                                   on_text=lambda t: print(t, end="", flush=True))
+            print()
+        else:
+            text, tokens = run_llm(llm, inj_prompt, args.max_tokens, args.temp, grammar_text)
+            print(text)
+        elapsed = time.perf_counter() - t0
+        if spec:
+            logger.debug("%s: 受理率≈%.0f%%（提案 %d tok / 検証 %d 回） %.1f tok/s", spec.label,
+                         100 * spec.acceptance(tokens), spec.proposed, spec.calls,
+                         tokens / elapsed if elapsed else 0.0)
+        if cache_kv:
+            logger.debug("%s", cache_kv.summary())
+
+    if cache and text:
+        cache.put(key, model_id, text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+check_import_time.py – --dry-run / スキップ日の起動経路の import 時間を検査する
+
+`python -X importtime` で src/lineworks_cred_llm.py を次の経路で実行し、
+  dry_run … LOCAL_LLM 未設定の --dry-run（フォールバック本文を表示して終了）
+  skip    … SKIP_DATES に当日を入れた通常実行（スキップ判定で終了）
+- 重い依存（selenium / requests / jpholiday / llama_cpp）が読み込まれていないこと
+- import の合計時間が予算（既定 250ms、IMPORT_BUDGET_MS で変更）以内であること
+を確認する。違反があれば終了コード 1（変更後の手元確認や CI 用）。
+
+    python ops/check_import_time.py
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from datetime import date
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TARGET = PROJECT_ROOT / "src" / "lineworks_cred_llm.py"
+FORBIDDEN = ("selenium", "requests", "jpholiday", "llama_cpp")
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "250"))
+
+PATHS = {
+    "dry_run": (["--dry-run"], {}),
+    "skip": ([], {"SKIP_DATES": date.today().isoformat()}),
+}
+
+
+def import_profile(argv: list[str], env: dict) -> tuple[float, list[tuple[str, float]], str]:
+    """(合計ms, [(モジュール, 累積ms)], stderr) を返す。"""
+    run_env = {**os.environ, "LOCAL_LLM": "", "METRICS": "0", "LLM_CACHE": "off", **env}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", str(TARGET), *argv],
+        cwd=PROJECT_ROOT, env=run_env, capture_output=True, text=True,
+    )
+    total_us = 0
+    modules: list[tuple[str, float]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        modules.append((name.rstrip(), int(cumulative_us) / 1000))
+    if proc.returncode != 0:
+        raise SystemExit(f"{TARGET.name} {' '.join(argv)} が失敗しました（exit {proc.returncode}）\n{proc.stderr[-2000:]}")
+    return total_us / 1000, modules, proc.stderr
+
+
+def main() -> int:
+    failed = False
+    for label, (argv, env) in PATHS.items():
+        total_ms, modules, _ = import_profile(argv, env)
+        loaded = {name.strip().split(".")[0] for name, _ in modules}
+        heavy = [m for m in FORBIDDEN if m in loaded]
+        top = sorted((m for m in modules if not m[0].startswith("  ")), key=lambda m: -m[1])[:5]
+        status = "OK" if total_ms <= BUDGET_MS and not heavy else "NG"
+        print(f"[{status}] {label}: import {total_ms:.1f}ms（予算 {BUDGET_MS:.0f}ms）")
+        for name, ms in top:
+            print(f"       {ms:8.1f}ms  {name.strip()}")
+        if heavy:
+            print(f"       不要な依存を読み込んでいます: {', '.join(heavy)}")
+        failed |= status == "NG"
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+browser_daemon.py – 常駐 Chrome のスーパーバイザ
+
+ログイン済みプロファイル（CHROME_PROFILE_DIR）で Chrome を
+--remote-debugging-port 付きで起動し、Talk タブを開いたまま維持する。
+プロセスが落ちる／DevTools が応答しなくなったら再起動する。
+
+投稿ジョブ（lineworks_cred_llm.py）は CHROME_DEBUGGER_ADDRESS に
+このアドレスを設定すると、Chrome を起動せず debuggerAddress で接続する。
+デーモンが居なければ従来どおりコールド起動にフォールバックする。
+
+USAGE:
+  python src/browser_daemon.py            # フォアグラウンドで常駐（launchd の KeepAlive 推奨）
+
+初回はプロファイルが未ログインのため、CHROME_DEBUGGER_ADDRESS を設定して
+投稿ジョブ（--dry-run 以外）を1度実行すれば、そのセッションが以後も再利用される。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+TALK_URL = "https://talk.worksmobile.com/#/"
+DEFAULT_PROFILE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "chrome-profile"
+DEFAULT_PORT = 9222
+CHECK_INTERVAL_SEC = 15
+MAX_BACKOFF_SEC = 300
+
+logger = logging.getLogger(__name__)
+
+
+def debugger_alive(address: str, timeout: float = 1.0) -> bool:
+    """DevTools エンドポイント（host:port）が応答するかを確認する。"""
+    try:
+        with urllib.request.urlopen(f"http://{address}/json/version", timeout=timeout) as r:
+            return r.status == 200
+    except (OSError, ValueError):
+        return False
+
+
+def _default_chrome_binary() -> str:
+    env = os.getenv("CHROME_BINARY", "")
+    if env:
+        return env
+    mac = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
+    if Path(mac).exists():
+        return mac
+    for name in ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser"):
+        found = shutil.which(name)
+        if found:
+            return found
+    raise RuntimeError("Chrome が見つかりません。CHROME_BINARY を設定してください")
+
+
+class BrowserSupervisor:
+    """Chrome プロセスを1つ保持し、落ちたら指数バックオフで再起動する。"""
+
+    def __init__(self, port: int, profile_dir: Path, headless: bool = True):
+        self.port = port
+        self.address = f"127.0.0.1:{port}"
+        self.profile_dir = profile_dir
+        self.headless = headless
+        self.proc: subprocess.Popen | None = None
+        self._stopping = False
+
+    def _command(self) -> list[str]:
+        cmd = [
+            _default_chrome_binary(),
+            f"--remote-debugging-port={self.port}",
+            "--remote-debugging-address=127.0.0.1",
+            f"--user-data-dir={self.profile_dir}",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--disable-gpu",
+            "--disable-dev-shm-usage",
+            "--window-size=1280,900",
+        ]
+        if self.headless:
+            cmd.append("--headless=new")
+        return cmd + [TALK_URL]
+
+    def start(self) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self.proc = subprocess.Popen(self._command(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if debugger_alive(self.address):
+                logger.info("Chrome を起動しました（pid=%s, debuggerAddress=%s）", self.proc.pid, self.address)
+                return
+            if self.proc.poll() is not None:
+                break
+            time.sleep(0.5)
+        raise RuntimeError(f"Chrome の DevTools が応答しません（exit={self.proc.poll()}）")
+
+    def stop(self) -> None:
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+
+    def healthy(self) -> bool:
+        return bool(self.proc) and self.proc.poll() is None and debugger_alive(self.address, timeout=3)
+
+    def ensure_talk_tab(self) -> None:
+        """Talk タブが無くなっていれば開き直す。"""
+        try:
+            with urllib.request.urlopen(f"http://{self.address}/json/list", timeout=3) as r:
+                tabs = json.loads(r.read().decode("utf-8"))
+            if any("talk.worksmobile.com" in t.get("url", "") for t in tabs if t.get("type") == "page"):
+                return
+            req = urllib.request.Request(
+                f"http://{self.address}/json/new?{urllib.parse.quote(TALK_URL, safe='')}", method="PUT"
+            )
+            urllib.request.urlopen(req, timeout=3).close()
+            logger.info("Talk タブを開き直しました")
+        except (OSError, ValueError) as e:
+            logger.warning("Talk タブの確認に失敗しました: %s", e)
+
+    def run_forever(self) -> None:
+        backoff = 5
+        while not self._stopping:
+            if not self.healthy():
+                if self.proc:
+                    logger.warning("Chrome が応答しません（exit=%s）→ 再起動します", self.proc.poll())
+                self.stop()
+                try:
+                    self.start()
+                    backoff = 5
+                except Exception as e:
+                    logger.error("Chrome の起動に失敗しました: %s（%ds 後に再試行）", e, backoff)
+                    self.stop()
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF_SEC)
+                    continue
+            self.ensure_talk_tab()
+            time.sleep(CHECK_INTERVAL_SEC)
+        self.stop()
+
+    def request_stop(self, *_):
+        self._stopping = True
+
+
+def main() -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    address = os.getenv("CHROME_DEBUGGER_ADDRESS", "")
+    port = int(address.rsplit(":", 1)[1]) if ":" in address else DEFAULT_PORT
+    profile_dir = Path(os.getenv("CHROME_PROFILE_DIR") or DEFAULT_PROFILE_DIR).expanduser().resolve()
+
+    sup = BrowserSupervisor(port, profile_dir, headless=os.getenv("HEADLESS", "1") != "0")
+    signal.signal(signal.SIGTERM, sup.request_stop)
+    signal.signal(signal.SIGINT, sup.request_stop)
+    logger.info("ブラウザデーモンを開始します（profile=%s, port=%d）", profile_dir, port)
+    sup.run_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+business_calendar.py – 投稿日カレンダー（土日・祝日・除外日を年単位で前計算）
+
+土日・祝日（jpholiday）・指定除外日（SKIP_DATES / skip_dates.txt / SKIP_DATES_FILE）を
+1年分まとめて 1日1バイトのフラグ列と累積の投稿日数に変換し、以降の問い合わせは表引きで返す。
+  is_postable(day)      … その日に投稿するか（O(1)）
+  skip_reason(day)      … 投稿しない理由（"skip" / "weekend" / "holiday"、投稿日なら None）
+  next_postable(n, day) … day 以降の投稿日を n 日分
+  count_between(a, b)   … a〜b（両端含む）の投稿日数（年ごとの累積差で O(年数)）
+
+除外日の指定（SKIP_DATES の値、ファイルのパスと更新時刻）が変わったときだけ作り直す。
+run_if_business_day.py と lineworks_cred_llm.py は calendar_for(base) で同じインスタンスを共有する。
+jpholiday は祝日を引く必要が出たときだけ import する（除外日・土日のスキップでは読み込まない）。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import os
+import re
+import threading
+from array import array
+from pathlib import Path
+
+WEEKEND, HOLIDAY, SKIP = 1, 2, 4
+_POSTABLE = b"\x00"
+
+
+def parse_tokens(s: str):
+    """SKIP_DATES などの文字列をパースして、日付集合を返す。"""
+    full_dates: set[dt.date] = set()        # YYYY-MM-DD 固定日
+    recur_md: set[tuple[int, int]] = set()  # (MM,DD) 毎年
+    if not s:
+        return full_dates, recur_md
+    for tok in re.split(r"[,\s]+", s.strip()):
+        if not tok:
+            continue
+        if re.fullmatch(r"\d{4}-\d{2}-\d{2}", tok):
+            y, m, d = map(int, tok.split("-"))
+            full_dates.add(dt.date(y, m, d))
+        elif re.fullmatch(r"\d{2}-\d{2}", tok):
+            m, d = map(int, tok.split("-"))
+            recur_md.add((m, d))
+        else:
+            # 不正フォーマットは黙って無視
+            pass
+    return full_dates, recur_md
+
+
+def skip_file(base: Path) -> Path:
+    return Path(os.environ.get("SKIP_DATES_FILE") or str(base / "skip_dates.txt"))
+
+
+def load_skip_dates(base: Path):
+    """環境変数とファイルから除外日を読み込む。"""
+    full_dates: set[dt.date] = set()
+    recur_md: set[tuple[int, int]] = set()
+
+    # 1) 環境変数 SKIP_DATES
+    f1, r1 = parse_tokens(os.environ.get("SKIP_DATES", ""))
+    full_dates |= f1
+    recur_md |= r1
+
+    # 2) ファイル（デフォルトは ./skip_dates.txt）
+    p = skip_file(base)
+    if p.exists():
+        for raw in p.read_text(encoding="utf-8").splitlines():
+            line = raw.split("#", 1)[0].strip()
+            if not line:
+                continue
+            f2, r2 = parse_tokens(line)
+            full_dates |= f2
+            recur_md   |= r2
+
+    return full_dates, recur_md
+
+
+class _Year:
+    """1年分のフラグ列（1日1バイト、0 が投稿日）と、先頭からの投稿日数の累積。"""
+
+    def __init__(self, year: int, flags: bytearray):
+        self.start = dt.date(year, 1, 1)
+        self.flags = flags
+        self.prefix = array("H", [0])
+        for f in flags:
+            self.prefix.append(self.prefix[-1] + (f == 0))
+
+    def index(self, day: dt.date) -> int:
+        return (day - self.start).days
+
+
+class BusinessCalendar:
+    """base/skip_dates.txt と環境変数の除外日を含む投稿日カレンダー（スレッドから共有してよい）。"""
+
+    def __init__(self, base: Path):
+        self.base = Path(base)
+        self._lock = threading.Lock()
+        self._sig: tuple | None = None
+        self._full: set[dt.date] = set()
+        self._recur: set[tuple[int, int]] = set()
+        self._years: dict[int, _Year] = {}
+
+    def _signature(self) -> tuple:
+        p = skip_file(self.base)
+        try:
+            st = p.stat()
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        return os.environ.get("SKIP_DATES", ""), str(p), stamp
+
+    def _refresh(self) -> None:
+        """除外日の指定が変わっていれば読み直し、年ごとの表を捨てる。"""
+        sig = self._signature()
+        if sig == self._sig:
+            return
+        with self._lock:
+            if sig != self._sig:
+                self._full, self._recur = load_skip_dates(self.base)
+                self._years = {}
+                self._sig = sig
+
+    def _year(self, year: int) -> _Year:
+        y = self._years.get(year)
+        if y is not None:
+            return y
+        import jpholiday
+
+        start = dt.date(year, 1, 1)
+        flags = bytearray((dt.date(year + 1, 1, 1) - start).days)
+        for i in range(len(flags)):
+            day = start + dt.timedelta(days=i)
+            if day.weekday() >= 5:
+                flags[i] |= WEEKEND
+            if day in self._full or (day.month, day.day) in self._recur:
+                flags[i] |= SKIP
+        for day, _name in jpholiday.year_holidays(year):
+            flags[(day - start).days] |= HOLIDAY
+        y = _Year(year, flags)
+        with self._lock:
+            return self._years.setdefault(year, y)
+
+    def _is_skip(self, day: dt.date) -> bool:
+        return day in self._full or (day.month, day.day) in self._recur
+
+    def skip_reason(self, day: dt.date) -> str | None:
+        """投稿しない理由。除外日と土日は祝日表を作らずに判定する。"""
+        self._refresh()
+        if self._is_skip(day):
+            return "skip"
+        if day.weekday() >= 5:
+            return "weekend"
+        y = self._year(day.year)
+        return "holiday" if y.flags[y.index(day)] & HOLIDAY else None
+
+    def is_postable(self, day: dt.date) -> bool:
+        self._refresh()
+        y = self._year(day.year)
+        return y.flags[y.index(day)] == 0
+
+    def is_business(self, day: dt.date) -> bool:
+        """月〜金かつ祝日でないか（除外日は見ない）。"""
+        self._refresh()
+        y = self._year(day.year)
+        return not y.flags[y.index(day)] & (WEEKEND | HOLIDAY)
+
+    def next_postable(self, n: int, start: dt.date | None = None) -> list[dt.date]:
+        """start（既定は今日）以降の投稿日を n 日分返す。"""
+        self._refresh()
+        day = start or dt.date.today()
+        days: list[dt.date] = []
+        while len(days) < n:
+            y = self._year(day.year)
+            i = y.flags.find(_POSTABLE, y.index(day))
+            if i < 0:
+                day = dt.date(day.year + 1, 1, 1)
+                continue
+            days.append(y.start + dt.timedelta(days=i))
+            day = days[-1] + dt.timedelta(days=1)
+        return days
+
+    def count_between(self, a: dt.date, b: dt.date) -> int:
+        """a〜b（両端含む）の投稿日数。a > b なら 0。"""
+        self._refresh()
+        total = 0
+        for year in range(a.year, b.year + 1):
+            y = self._year(year)
+            lo = y.index(a) if year == a.year else 0
+            hi = y.index(b) + 1 if year == b.year else len(y.flags)
+            if lo < hi:
+                total += y.prefix[hi] - y.prefix[lo]
+        return total
+
+
+_CALENDARS: dict[Path, BusinessCalendar] = {}
+
+
+def calendar_for(base: Path) -> BusinessCalendar:
+    """base ごとに1つのカレンダーを返す（同一プロセス内で使い回す）。"""
+    key = Path(base).resolve()
+    cal = _CALENDARS.get(key)
+    if cal is None:
+        cal = _CALENDARS.setdefault(key, BusinessCalendar(key))
+    return cal
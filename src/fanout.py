@@ -0,0 +1,314 @@
+"""
+fanout.py – 複数アカウント × 複数ルームへの一括投稿（ブラウザセッション数に上限のあるプール）
+
+ジョブ定義ファイル（JSON）:
+
+    {
+      "accounts": {
+        "yanagi": {"name": "柳太郎", "id_env": "LW_YANAGI_ID", "pass_env": "LW_YANAGI_PASS",
+                   "profile_dir": "~/.lw-profiles/yanagi"}
+      },
+      "templates": {
+        "credo":  {"kind": "credo"},
+        "notice": {"kind": "text", "text": "{date} の定例は 17:00 からです"}
+      },
+      "jobs": [
+        {"account": "yanagi", "rooms": ["●Team柳", "●全体"], "template": "credo"}
+      ]
+    }
+
+- 資格情報はファイルに書かず、環境変数名（id_env / pass_env）で参照する
+- name は投稿文の署名（kind=credo のジョブがあるアカウントでは必須）
+- profile_dir / debugger_address は任意。アカウント間で同じものは使えない（Chrome の
+  プロファイルと常駐ブラウザのログインは1アカウントにつき1つ）
+- 同じアカウントのジョブは1つのブラウザでログインし、ルームを順に回る
+- 別アカウントは並列。同時セッション数は FANOUT_MAX_SESSIONS（既定 4）までで、さらに
+  空きメモリが FANOUT_SESSION_MB（既定 600）×（ログイン中のセッション数 + 1）に満たない間は新規起動を待つ
+- テンプレートの本文は実行ごとに1回だけ作り、同じテンプレートのジョブで共有する
+  （kind=credo は本体の compose_credo の本文に各アカウントの署名を付ける、
+   kind=text は {date} / {weekday} を埋めた固定文）
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from metrics import RUN
+
+if TYPE_CHECKING:
+    from locator import LocatorCache
+    from posters import Poster
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_KINDS = ("credo", "text")
+WEEKDAYS_JP = "月火水木金土日"
+
+
+class Account:
+    """投稿に使う LINE WORKS アカウント（1アカウント = 1ブラウザセッション）。"""
+
+    def __init__(self, name: str, lw_id: str, lw_pass: str, display_name: str = "",
+                 profile_dir: str = "", debugger_address: str = ""):
+        self.name = name
+        self.display_name = display_name
+        self.lw_id = lw_id
+        self.lw_pass = lw_pass
+        self.profile_dir = profile_dir
+        self.debugger_address = debugger_address
+
+
+class Job:
+    """1アカウント × 1ルーム × 1テンプレート。実行後に ok / error / sec が入る。"""
+
+    def __init__(self, account: str, room: str, template: str):
+        self.account = account
+        self.room = room
+        self.template = template
+        self.ok: bool | None = None
+        self.error = ""
+        self.sec = 0.0
+
+    def record(self) -> dict:
+        return {"account": self.account, "room": self.room, "template": self.template,
+                "ok": self.ok, "error": self.error, "sec": round(self.sec, 3)}
+
+
+# ─────────── ジョブ定義 ─────────── #
+def load_jobs(path: Path | str, check_env: bool = True) -> tuple[dict[str, Account], dict[str, dict], list[Job]]:
+    """ジョブ定義を読み、(accounts, templates, jobs) を返す。
+
+    書式の誤りは ValueError、check_env=True で参照先の環境変数が空なら RuntimeError。
+    """
+    spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(spec, dict):
+        raise ValueError(f"{path}: トップレベルはオブジェクトにしてください")
+
+    accounts: dict[str, Account] = {}
+    env_names: dict[str, tuple[str, str]] = {}
+    for name, a in (spec.get("accounts") or {}).items():
+        id_env, pass_env = a.get("id_env", ""), a.get("pass_env", "")
+        if not id_env or not pass_env:
+            raise ValueError(f"{path}: accounts.{name} に id_env / pass_env を指定してください")
+        env_names[name] = (id_env, pass_env)
+        accounts[name] = Account(name, os.getenv(id_env, ""), os.getenv(pass_env, ""),
+                                 display_name=a.get("name", ""),
+                                 profile_dir=a.get("profile_dir", ""),
+                                 debugger_address=a.get("debugger_address", ""))
+    for attr in ("profile_dir", "debugger_address"):
+        used = [getattr(acc, attr) for acc in accounts.values() if getattr(acc, attr)]
+        if len(used) != len(set(used)):
+            raise ValueError(f"{path}: {attr} はアカウントごとに別のものを指定してください")
+
+    templates: dict[str, dict] = spec.get("templates") or {"credo": {"kind": "credo"}}
+    for name, t in templates.items():
+        if t.get("kind") not in TEMPLATE_KINDS:
+            raise ValueError(f"{path}: templates.{name}.kind は {' / '.join(TEMPLATE_KINDS)} のいずれか")
+        if t["kind"] == "text" and not t.get("text"):
+            raise ValueError(f"{path}: templates.{name} に text を指定してください")
+
+    jobs: list[Job] = []
+    for i, j in enumerate(spec.get("jobs") or []):
+        account, template = j.get("account"), j.get("template", "credo")
+        rooms = j.get("rooms") or ([j["room"]] if j.get("room") else [])
+        if account not in accounts:
+            raise ValueError(f"{path}: jobs[{i}] のアカウント {account!r} が accounts にありません")
+        if template not in templates:
+            raise ValueError(f"{path}: jobs[{i}] のテンプレート {template!r} が templates にありません")
+        if not rooms:
+            raise ValueError(f"{path}: jobs[{i}] に rooms を指定してください")
+        jobs += [Job(account, room, template) for room in rooms]
+    if not jobs:
+        raise ValueError(f"{path}: jobs が空です")
+    for job in jobs:
+        if templates[job.template]["kind"] == "credo" and not accounts[job.account].display_name:
+            raise ValueError(f"{path}: accounts.{job.account} に name（投稿文の署名）を指定してください")
+
+    missing = sorted({v for job in jobs for v in env_names[job.account] if not os.getenv(v)})
+    if missing and check_env:
+        raise RuntimeError(f"環境変数 {' / '.join(missing)} を設定してください（.env 推奨）")
+    return accounts, templates, jobs
+
+
+def render_text(template: dict, day: date | None = None) -> str:
+    """kind=text のテンプレートに日付を埋める。"""
+    day = day or date.today()
+    return template["text"].format(date=day.isoformat(), weekday=WEEKDAYS_JP[day.weekday()])
+
+
+# ─────────── メモリに応じた同時セッション数 ─────────── #
+def available_memory_mb() -> float | None:
+    """空きメモリ（MB）。Linux は /proc/meminfo、macOS は vm_stat。取れなければ None。"""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if sys.platform == "darwin":
+        try:
+            out = subprocess.run(["vm_stat"], capture_output=True, text=True, timeout=5).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        m = re.search(r"page size of (\d+) bytes", out)
+        pages = sum(int(n) for n in re.findall(
+            r"Pages (?:free|inactive|speculative|purgeable):\s+(\d+)", out))
+        if m and pages:
+            return pages * int(m.group(1)) / 1024 / 1024
+    return None
+
+
+class SessionGate:
+    """ブラウザの新規起動を、空きメモリが1セッション分以上あるときだけ通す。
+
+    起動中（ログイン完了前）のセッションはまだメモリを使い切っていないため、その数だけ
+    必要量を積み増して判定する。動いているセッションが無いときは常に通す（必ず前に進む）。
+    """
+
+    def __init__(self, session_mb: float, poll_sec: float = 2.0):
+        self.session_mb = session_mb
+        self.poll_sec = poll_sec
+        self._cond = threading.Condition()
+        self.active = 0
+        self.starting = 0
+
+    def _fits(self) -> bool:
+        mem = available_memory_mb()
+        return mem is None or mem >= self.session_mb * (1 + self.starting)
+
+    def acquire(self, label: str) -> None:
+        with self._cond:
+            waited = False
+            while self.active and not self._fits():
+                if not waited:
+                    logger.info("[fanout] %s: 空きメモリ待ち（動作中 %d セッション）", label, self.active)
+                    waited = True
+                self._cond.wait(self.poll_sec)
+            self.active += 1
+            self.starting += 1
+
+    def started(self) -> None:
+        with self._cond:
+            self.starting -= 1
+            self._cond.notify_all()
+
+    def release(self, started: bool) -> None:
+        with self._cond:
+            self.active -= 1
+            if not started:
+                self.starting -= 1
+            self._cond.notify_all()
+
+
+# ─────────── 実行 ─────────── #
+def selenium_session(account: Account, cache: LocatorCache | None = None) -> Poster:
+    """アカウント用の SeleniumPoster（ルームは開かずログインまで）。"""
+    from lw_selenium import SeleniumPoster
+    return SeleniumPoster("", account.lw_id, account.lw_pass,
+                          profile_dir=account.profile_dir, debugger_address=account.debugger_address,
+                          cache=cache, label=account.name)
+
+
+def run_account(account: Account, jobs: list[Job], messages: dict[tuple[str, str], Future],
+                gate: SessionGate, make_session: Callable[[Account], Poster]) -> None:
+    """1アカウントのジョブを1セッションで順に投稿する。失敗はジョブ単位で記録して次へ進む。
+
+    messages は (テンプレート名, アカウント名) → 投稿文の Future。
+    """
+    poster = make_session(account)
+    gate.acquire(account.name)
+    t0 = time.perf_counter()
+    try:
+        with RUN.span("fanout.login", account=account.name) as sp:
+            poster.open()
+            sp["login_path"] = getattr(poster, "login_path", "")
+    except BaseException as e:
+        poster.close(e)
+        gate.release(started=False)
+        if not isinstance(e, Exception):
+            raise
+        logger.error("[fanout] %s: ログインに失敗しました（%s）", account.name, e)
+        for job in jobs:
+            job.ok, job.error, job.sec = False, f"login: {type(e).__name__}: {e}", time.perf_counter() - t0
+        return
+    gate.started()
+
+    exc: BaseException | None = None
+    try:
+        for job in jobs:
+            t = time.perf_counter()
+            try:
+                with RUN.span("fanout.job", account=account.name, room=job.room, template=job.template):
+                    poster.select_room(job.room)
+                    poster.send(messages[(job.template, account.name)].result())
+                job.ok = True
+            except Exception as e:
+                job.ok, job.error = False, f"{type(e).__name__}: {e}"
+                logger.warning("[fanout] %s → %s: 投稿に失敗しました（%s）", account.name, job.room, e)
+            job.sec = time.perf_counter() - t
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        poster.close(exc)
+        gate.release(started=True)
+
+
+def run_jobs(accounts: dict[str, Account], jobs: list[Job], messages: dict[tuple[str, str], Future],
+             make_session: Callable[[Account], Poster] | None = None) -> list[Job]:
+    """アカウントごとにまとめ、上限付きのスレッドプールで並列に投稿する。
+
+    make_session 省略時は SeleniumPoster を使い、LocatorCache は全セッションで1つを共有する
+    （各セッションが別々に読み書きすると、後から保存した側が他の学習結果を消すため）。
+    """
+    if make_session is None:
+        from locator import LocatorCache
+        cache = LocatorCache()
+
+        def make_session(account: Account) -> Poster:
+            return selenium_session(account, cache)
+
+    by_account: dict[str, list[Job]] = {}
+    for job in jobs:
+        by_account.setdefault(job.account, []).append(job)
+
+    max_sessions = max(1, int(os.getenv("FANOUT_MAX_SESSIONS", "4")))
+    gate = SessionGate(float(os.getenv("FANOUT_SESSION_MB", "600")))
+    workers = min(max_sessions, len(by_account))
+    mem = available_memory_mb()
+    logger.info("[fanout] %d ジョブ / %d アカウント（同時 %d セッションまで、空きメモリ %s）",
+                len(jobs), len(by_account), workers, f"{mem:.0f}MB" if mem is not None else "不明")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fanout") as pool:
+        futures = [pool.submit(run_account, accounts[name], account_jobs, messages, gate, make_session)
+                   for name, account_jobs in by_account.items()]
+        for fut in futures:
+            fut.result()
+    return jobs
+
+
+def report(jobs: list[Job]) -> int:
+    """ジョブごとの結果をログに出し、失敗件数を返す。"""
+    failed = 0
+    for job in jobs:
+        if job.ok:
+            logger.info("[fanout] OK   %s → %s（%s, %.1fs）", job.account, job.room, job.template, job.sec)
+        else:
+            failed += 1
+            logger.error("[fanout] FAIL %s → %s（%s, %.1fs）: %s",
+                         job.account, job.room, job.template, job.sec, job.error)
+    logger.info("[fanout] 成功 %d / 失敗 %d", len(jobs) - failed, failed)
+    RUN.set(jobs=[job.record() for job in jobs])
+    return failed
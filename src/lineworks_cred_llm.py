@@ -3,42 +3,31 @@ from __future__ import annotations
 import os
 import sys
 import re
+import json
 import time
 import random
 import logging
 import argparse
-from datetime import date
+import threading
+from concurrent.futures import Future, as_completed
+from datetime import date, timedelta
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import jpholiday
-import requests
 from dotenv import load_dotenv
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import TimeoutException, WebDriverException
+# jpholiday / selenium / requests（ollama_client, lw_botapi）は必要になった経路でだけ import する。
+# --dry-run（LOCAL_LLM 未設定時）やスキップ日は Selenium も requests も読み込まずに終わる。
+if TYPE_CHECKING:
+    from ollama_client import OllamaClient
+    from posters import Poster
 
 
 # ─────────── 定数 ─────────── #
-LOGIN_URL = (
-    "https://auth.worksmobile.com/login/login"
-    "?accessUrl=https%3A%2F%2Ftalk.worksmobile.com%2F%23%2F"
-)
-TALK_URL = "https://talk.worksmobile.com/#/"
-DEFAULT_WAIT_SEC = 240
 ROOM_NAME = "●Team柳"
+AUTHOR_NAME = "福原玄"  # 投稿文の署名（--jobs ではアカウントごとの name）
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
 
-# ─────────── CLI ─────────── #
-parser = argparse.ArgumentParser()
-parser.add_argument("--dry-run", dest="dry_run", action="store_true",
-                    help="生成文を表示のみ（UI操作・投稿は行わない）")
-args = parser.parse_args()
 
 # ─────────── env & logger ─────────── #
 load_dotenv()
@@ -48,21 +37,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ─────────── 認証情報 ─────────── #
-LW_ID = os.getenv("LINEWORKS_ID", "")
-LW_PASS = os.getenv("LINEWORKS_PASS", "")
-if not LW_ID or not LW_PASS:
-    logger.error("環境変数 LINEWORKS_ID / LINEWORKS_PASS を設定してください（.env 推奨）")
-    sys.exit(1)
+# .env 反映後に読み込む（バックエンドは環境変数から設定を読むため）
+from posters import POSTER_KINDS, make_poster  # noqa: E402
+from pregen_store import PregenStore  # noqa: E402
+from llm_cache import LLMCache, cache_key, cache_mode  # noqa: E402
+from metrics import RUN  # noqa: E402
+from business_calendar import calendar_for  # noqa: E402
 
-# ─────────── Chrome 設定 ─────────── #
-CHROME_BINARY = os.getenv("CHROME_BINARY", "")
-CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "")
-HEADLESS = os.getenv("HEADLESS", "1")  # "0" で画面表示
+
+# ─────────── CLI ─────────── #
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true",
+                        help="生成文を表示のみ（UI操作・投稿は行わない）")
+    parser.add_argument("--poster", choices=POSTER_KINDS, default=os.getenv("POSTER", "selenium"),
+                        help="投稿バックエンド（既定: 環境変数 POSTER、未設定なら selenium）")
+    parser.add_argument("--pipeline", action="store_true", default=os.getenv("PIPELINE", "0") == "1",
+                        help="本文生成とブラウザ起動・ログインを並行実行（環境変数 PIPELINE=1 でも可）")
+    parser.add_argument("--pregenerate", type=int, metavar="N", default=0,
+                        help="明日以降の N 営業日分の本文を事前生成して保存（投稿は行わない）")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Ollama にモデルを先読みさせて終了（本番の数分前に実行する想定）")
+    parser.add_argument("--bench-gen", type=int, metavar="N", default=0,
+                        help="生成だけを N 回実行し、1回目で規定を満たした割合と所要時間を表示")
+    parser.add_argument("--jobs", metavar="FILE", default=os.getenv("JOBS_FILE", ""),
+                        help="ジョブ定義（アカウント×ルーム×テンプレート）の全ジョブを投稿（src/fanout.py 参照）")
+    return parser.parse_args(argv)
 
 # ─────────── Ollama（ローカルLLM）設定 ─────────── #
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
 LOCAL_LLM = os.getenv("LOCAL_LLM", "").strip()  # 例: gpt-oss:20b / llama3.1:8b-instruct-q4_K_M
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m")  # 生成後もモデルを常駐させる時間
+# "1" でストリーミング生成し、規定長の1文が揃った時点で打ち切る
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "0") == "1"
+# 2 以上で N 候補を同時に生成し、GEN_QUORUM 件の有効候補が揃った時点で最良を採用
+GEN_CANDIDATES = max(1, int(os.getenv("GEN_CANDIDATES", "1")))
+GEN_QUORUM = max(1, min(GEN_CANDIDATES, int(os.getenv("GEN_QUORUM", "1"))))
+# "1" で JSON スキーマ（format）により出力を日本語1文・規定長に制約してデコード
+OLLAMA_CONSTRAINED = os.getenv("OLLAMA_CONSTRAINED", "0") == "1"
+
+_ollama: OllamaClient | None = None
+
+
+def ollama_client() -> OllamaClient:
+    """プロセス内で共有する Ollama クライアント（接続プールを使い回す）。"""
+    global _ollama
+    if _ollama is None:
+        from ollama_client import OllamaClient
+        _ollama = OllamaClient(OLLAMA_HOST, LOCAL_LLM, keep_alive=OLLAMA_KEEP_ALIVE,
+                               pool_size=max(4, GEN_CANDIDATES))
+    return _ollama
+
+
+# 応答キャッシュ: LLM_CACHE=auto（既定）は --dry-run のときだけ使い、
+# 本番投稿・事前生成・--bench-gen では常に新しく生成する。on / off で強制できる。main() で確定する。
+LLM_CACHE_MODE = cache_mode()
+USE_LLM_CACHE = LLM_CACHE_MODE == "on"
+_llm_cache: LLMCache | None = None
+
+
+def llm_cache() -> LLMCache | None:
+    """キャッシュ有効時のみ共有インスタンスを返す。"""
+    global _llm_cache
+    if USE_LLM_CACHE and _llm_cache is None:
+        _llm_cache = LLMCache()
+    return _llm_cache
 
 # ─────────── クレド定義（フォールバック用）─────────── #
 CREDOS = {
@@ -201,16 +240,101 @@ def _clamp_length_jp(text: str, min_len: int = MIN_LEN, max_len: int = MAX_LEN)
             s = s.rstrip("、：") + "。"
     return s
 
-def gen_credo_with_local_llm(idx: int, title: str) -> str:
-    """Ollama ローカルLLMで生成（最大5回）
-       - 1st: 通常生成
-       - 短すぎ: 「同内容で50字前後に膨らませて再出力」を依頼
-       - 最終手段: 24字以上なら許容、それ未満は失敗
+def _sentence_settled(text: str) -> bool:
+    """句点まで来た時点で、後処理後の長さが規定内（または超過）なら以降の生成は不要。"""
+    if "。" not in text:
+        return False
+    head = post_clean(text[:text.rfind("。") + 1])
+    return not is_bad(head) or len(head) > MAX_LEN
+
+
+def _ask_stream(client: OllamaClient, prompt: str, options: dict,
+                cancel: threading.Event | None = None, span: dict | None = None, **extra) -> str:
+    """ストリーミングで生成し、規定長の1文が揃った時点で打ち切る。
+
+    format（制約付きデコード）指定時は受信途中の {"text": "... を本文に戻してから判定・切り出す。
     """
-    if not LOCAL_LLM:
-        raise RuntimeError("LOCAL_LLM not set")
+    constrained = "format" in extra
+
+    def _decode(text: str) -> str:
+        return _unwrap_constrained(text) if constrained else text
+
+    def _stop(text: str) -> bool:
+        return (cancel is not None and cancel.is_set()) or _sentence_settled(_decode(text))
+
+    res = client.generate_stream(prompt, options, stop_when=_stop, **extra)
+    text = _decode(res["response"])
+    if span is not None:
+        span.update(res["stats"] or {"eval_count": res["chunks"]})
+        span.update(early_stop=res["early_stop"], first_token_sec=round(res["first_token_sec"], 3))
+    if res["early_stop"]:
+        text = text[:text.rfind("。") + 1]
+        saved = max(0, options.get("num_predict", 0) - res["chunks"])
+        logger.info("ollama stream: 有効な1文を %.2fs で取得（初回トークン %.2fs, %d tok 受信, 最大 %d tok 節約）",
+                    res["elapsed_sec"], res["first_token_sec"], res["chunks"], saved)
+    else:
+        logger.info("ollama stream: 打ち切りなし（%.2fs, %d tok）", res["elapsed_sec"], res["chunks"])
+    return text.strip()
+
+
+GEN_OPTIONS = {"temperature": 0.4, "top_p": 0.9, "num_ctx": 2048, "num_predict": 120}
+TARGET_LEN = 50  # 候補比較時の理想長（プロンプトの 40〜60 文字の中央）
+
+# 制約付きデコード用スキーマ：漢字・かな・カナと「、：」のみ、句点1つで終わる MIN_LEN〜MAX_LEN 文字
+CREDO_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {
+            "type": "string",
+            "pattern": f"^[\u4E00-\u9FFF\u3040-\u309F\u30A0-\u30FF、：]{{{MIN_LEN - 1},{MAX_LEN - 1}}}。$",
+            "minLength": MIN_LEN,
+            "maxLength": MAX_LEN,
+        },
+    },
+    "required": ["text"],
+}
+
+# 1回目の生成で規定を満たした割合の計測用（--bench-gen で表示）
+GEN_STATS = {"runs": 0, "first_attempt_ok": 0, "fallback": 0}
+
+
+def _record_success(attempt: int, fallback: bool = False) -> None:
+    """成功した生成を記録する（24文字以上の最終手段で採用した場合は fallback=True）。"""
+    if fallback:
+        GEN_STATS["fallback"] += 1
+    elif attempt == 0:
+        GEN_STATS["first_attempt_ok"] += 1
+    logger.info("生成成功: attempt=%d constrained=%s fallback=%s", attempt + 1,
+                "on" if OLLAMA_CONSTRAINED else "off", "yes" if fallback else "no")
 
-    base_prompt = (
+
+_JSON_TEXT_HEAD = re.compile(r'\s*\{\s*"text"\s*:\s*"')
+
+
+def _unwrap_constrained(raw: str) -> str:
+    """format 指定時の {"text": ...} から本文を取り出す。
+
+    ストリームを途中で打ち切った閉じていない JSON も、先頭の {"text": " を外して
+    エスケープ（\\" や \\n など）を戻す。この形でなければそのまま返す（本文を渡しても同じ）。
+    """
+    try:
+        return str(json.loads(raw).get("text", ""))
+    except (ValueError, AttributeError):
+        pass
+    m = _JSON_TEXT_HEAD.match(raw)
+    if not m:
+        return raw
+    body = raw[m.end():]
+    try:
+        text, _ = json.decoder.scanstring(body + '"', 0, False)
+    except ValueError:
+        # 末尾のエスケープ（\ や \uXX）が途中で切れている
+        text, _ = json.decoder.scanstring(re.sub(r"\\(u[0-9a-fA-F]{0,3})?$", "", body) + '"', 0, False)
+    return text
+
+
+def _credo_prompt(idx: int, title: str) -> str:
+    return (
         f"{idx}. {title} の『気づき』を日本語のみで1文、40〜60文字で作成してください。\n"
         "・句点「。」で終える\n"
         "・英数字・記号は使わない\n"
@@ -219,16 +343,106 @@ def gen_credo_with_local_llm(idx: int, title: str) -> str:
         "・出力は本文のみ（前後に余計な語句や改行を付けない）"
     )
 
-    payload = {
-        "model": LOCAL_LLM,
-        "options": {"temperature": 0.4, "top_p": 0.9, "num_ctx": 2048, "num_predict": 120},
-        "stream": False,
-    }
+
+def _ask_llm(prompt: str, options: dict, cancel: threading.Event | None = None) -> str:
+    client = ollama_client()
+    extra = {"format": CREDO_JSON_SCHEMA} if OLLAMA_CONSTRAINED else {}
+    if OLLAMA_CONSTRAINED:
+        prompt += '\n・出力は {"text": "本文"} 形式の JSON のみ'
+    cache = llm_cache()
+    key = cache_key(client.model, prompt, {**options, **extra}) if cache else ""
+    with RUN.span("llm.attempt", stream=OLLAMA_STREAM, constrained=OLLAMA_CONSTRAINED) as sp:
+        raw = cache.get(key) if cache else None
+        sp["cached"] = raw is not None
+        if raw is None:
+            if OLLAMA_STREAM:
+                raw = _ask_stream(client, prompt, options, cancel, sp, **extra)
+            else:
+                from ollama_client import ollama_stats
+                data = client.generate(prompt, options, **extra)
+                sp.update(ollama_stats(data))
+                raw = (data.get("response") or "").strip()
+            if cache and raw:
+                cache.put(key, client.model, raw)
+        else:
+            logger.info("LLM キャッシュ命中（%s…）", key[:12])
+        sp["chars"] = len(raw)
+    return _unwrap_constrained(raw) if OLLAMA_CONSTRAINED else raw
+
+
+def _score_candidate(raw: str) -> tuple[str, int | None]:
+    """後処理済みの候補と評価値（小さいほど良い、規定外は None）を返す。"""
+    cleaned = post_clean(raw)
+    if len(cleaned) > MAX_LEN:
+        cleaned = _clamp_length_jp(cleaned, MIN_LEN, MAX_LEN)
+    if is_bad(cleaned):
+        return cleaned, None
+    return cleaned, abs(len(cleaned) - TARGET_LEN)
+
+
+def gen_credo_best_of_n(idx: int, title: str, n: int, quorum: int) -> str:
+    """seed を変えた n 候補を同時に生成し、有効候補が quorum 件揃った時点で最良を返す。
+
+    Ollama 側で並列処理させるにはサーバを OLLAMA_NUM_PARALLEL>=n で起動しておく。
+    """
+    prompt = _credo_prompt(idx, title)
+    # キャッシュ利用時は seed を固定し、同じ候補列が再利用されるようにする
+    base_seed = 0 if USE_LLM_CACHE else random.randrange(1 << 30)
+    cancel = threading.Event()
+    t0 = time.perf_counter()
+    valid: list[tuple[int, str]] = []
+    fallback = ""
+    last_err: Exception | None = None
+
+    # 候補はデーモンスレッドで走らせる（quorum 後に残った非ストリーミング要求を終了時に待たない）
+    futures = [_run_in_background(lambda s=base_seed + i: _ask_llm(prompt, {**GEN_OPTIONS, "seed": s}, cancel),
+                                  name=f"credo-cand-{i}") for i in range(n)]
+    try:
+        for done, fut in enumerate(as_completed(futures), 1):
+            try:
+                cleaned, score = _score_candidate(fut.result())
+            except Exception as e:
+                last_err = e
+                continue
+            if score is None:
+                fallback = max(fallback, cleaned, key=len)
+                continue
+            valid.append((score, cleaned))
+            if len(valid) >= quorum:
+                logger.info("best-of-%d: %d/%d 件受信で有効 %d 件 → 採用（%.2fs）",
+                            n, done, n, len(valid), time.perf_counter() - t0)
+                _record_success(0)
+                return min(valid)[1]
+    finally:
+        cancel.set()
+
+    if valid:
+        _record_success(0)
+        return min(valid)[1]
+    # 最終手段：24文字以上なら採用（逐次生成と同じ基準）
+    if len(fallback) >= 24:
+        _record_success(0, fallback=True)
+        return _clamp_length_jp(fallback, 24, MAX_LEN)
+    raise last_err or ValueError("no valid candidate")
+
+
+def gen_credo_with_local_llm(idx: int, title: str) -> str:
+    """Ollama ローカルLLMで生成（最大5回）
+       - 1st: 通常生成
+       - 短すぎ: 「同内容で50字前後に膨らませて再出力」を依頼
+       - 最終手段: 24字以上なら許容、それ未満は失敗
+       GEN_CANDIDATES>=2 のときは gen_credo_best_of_n() で同時生成する。
+    """
+    if not LOCAL_LLM:
+        raise RuntimeError("LOCAL_LLM not set")
+    GEN_STATS["runs"] += 1
+    if GEN_CANDIDATES > 1:
+        return gen_credo_best_of_n(idx, title, GEN_CANDIDATES, GEN_QUORUM)
+
+    base_prompt = _credo_prompt(idx, title)
 
     def _ask(prompt: str) -> str:
-        r = requests.post(f"{OLLAMA_HOST}/api/generate", json={**payload, "prompt": prompt}, timeout=120)
-        r.raise_for_status()
-        return (r.json().get("response") or "").strip()
+        return _ask_llm(prompt, GEN_OPTIONS)
 
     last_err = None
     for attempt in range(5):
@@ -246,6 +460,7 @@ def gen_credo_with_local_llm(idx: int, title: str) -> str:
 
             # まず長さが足りていればOK
             if MIN_LEN <= len(cleaned) <= MAX_LEN:
+                _record_success(attempt)
                 return cleaned
 
             # 短い場合はもう一押し（次ループで増量リライト）
@@ -256,6 +471,7 @@ def gen_credo_with_local_llm(idx: int, title: str) -> str:
             # 長すぎは安全に丸める
             cleaned = _clamp_length_jp(cleaned, MIN_LEN, MAX_LEN)
             if MIN_LEN <= len(cleaned) <= MAX_LEN:
+                _record_success(attempt)
                 return cleaned
             last_err = ValueError(f"length {len(cleaned)} out of range")
 
@@ -265,227 +481,373 @@ def gen_credo_with_local_llm(idx: int, title: str) -> str:
 
     # 最終手段：24文字以上なら採用（どうしても短いモデル対策）
     if 'cleaned' in locals() and len(cleaned) >= 24:
+        _record_success(attempt, fallback=True)
         return _clamp_length_jp(cleaned, 24, MAX_LEN)
 
     raise last_err or RuntimeError("local llm generation failed")
 
 
-# ─────────── Selenium ヘルパ ─────────── #
-def build_driver() -> webdriver.Chrome:
-    opts = Options()
-    if HEADLESS != "0":
-        opts.add_argument("--headless=new")
-    opts.add_argument("--disable-gpu")
-    opts.add_argument("--no-sandbox")
-    opts.add_argument("--disable-dev-shm-usage")
-    opts.add_argument("--window-size=1280,900")
-    if CHROME_BINARY:
-        opts.binary_location = CHROME_BINARY
-
-    if CHROMEDRIVER_PATH and Path(CHROMEDRIVER_PATH).is_file():
-        service = Service(executable_path=CHROMEDRIVER_PATH, start_timeout=240)
-        driver = webdriver.Chrome(service=service, options=opts)
-    else:
-        driver = webdriver.Chrome(options=opts)  # Selenium Manager に自動解決
+# ─────────── main ─────────── #
+def upcoming_posting_days(n: int, start: date) -> list[date]:
+    """start 以降の投稿日（平日・非祝日・非除外日）を n 日分返す。"""
+    return calendar_for(PROJECT_ROOT).next_postable(n, start)
 
-    try:
-        driver.set_page_load_timeout(180)
-    except Exception:
-        pass
-    return driver
 
+def pregenerate(n: int) -> int:
+    """明日以降の n 投稿日分を LLM で生成・検証して保存する。保存できた件数を返す。
 
-def _find_first(wait: WebDriverWait, selectors: list[tuple[By, str]]):
-    last_exc = None
-    for by, sel in selectors:
-        try:
-            return wait.until(EC.presence_of_element_located((by, sel)))
-        except TimeoutException as e:
-            last_exc = e
-    raise last_exc or TimeoutException("element not found")
+    当日分は対象にしない（夜間実行の時点で当日の投稿は済んでいるか、失敗していれば
+    再実行用に既存の分を残しておくため）。
+    """
+    if not LOCAL_LLM:
+        logger.error("事前生成には LOCAL_LLM の設定が必要です")
+        return 0
+    store = PregenStore()
+    try:
+        pruned = store.prune(date.today())
+        if pruned:
+            logger.info("期限切れの事前生成分を %d 件削除しました", pruned)
+        have = set(store.days())
+        saved = 0
+        for day in upcoming_posting_days(n, date.today() + timedelta(days=1)):
+            if day in have:
+                logger.info("%s は生成済みのためスキップ", day)
+                continue
+            idx, (title, _) = random.choice(list(CREDOS.items()))
+            try:
+                body = gen_credo_with_local_llm(idx, title)
+            except Exception as e:
+                logger.warning("%s の事前生成に失敗（%s）→ 当日生成に任せます", day, e)
+                continue
+            if is_bad(body):
+                logger.warning("%s の生成文が規定長外（%d文字）→ 保存しません", day, len(body))
+                continue
+            store.put(day, idx, title, body, LOCAL_LLM)
+            saved += 1
+            logger.info("%s: %d. %s ／ %s", day, idx, title, body)
+        return saved
+    finally:
+        store.close()
 
 
-def switch_to_iframe_with_form(driver: webdriver.Chrome, wait: WebDriverWait):
-    driver.switch_to.default_content()
-    for frame in driver.find_elements(By.TAG_NAME, "iframe"):
+def bench_generation(n: int) -> None:
+    """生成のみを n 回行い、1回目成功率・失敗数・所要時間の分布を表示する。"""
+    if not LOCAL_LLM:
+        logger.error("計測には LOCAL_LLM の設定が必要です")
+        return
+    times: list[float] = []
+    failed = 0
+    for i in range(n):
+        idx, (title, _) = random.choice(list(CREDOS.items()))
+        t0 = time.perf_counter()
         try:
-            wait.until(EC.frame_to_be_available_and_switch_to_it(frame))
-            if driver.find_elements(By.CSS_SELECTOR, "input[type='password']"):
-                return
-        except TimeoutException:
-            continue
-    driver.switch_to.default_content()
-
-
-def wait_talk_app_ready(driver: webdriver.Chrome, wait: WebDriverWait):
-    # DOM 完了
-    wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-    # 入力欄か検索欄のどちらかが出ればOK
-    wait.until(EC.any_of(
-        EC.presence_of_element_located((By.CSS_SELECTOR, "div.editor_input.message-input")),
-        EC.presence_of_element_located((By.CSS_SELECTOR, "input[placeholder*='検索']")),
-    ))
-
-
-def open_room(driver: webdriver.Chrome, wait: WebDriverWait, room_name: str) -> bool:
-    logger.info("%sルームを探しています...", room_name)
-    for attempt in range(1, 4):
-        rooms = wait.until(EC.presence_of_all_elements_located(
-            (By.CSS_SELECTOR, "li[data-role='channel-item'], li[data-qa*='channel']")
-        ))
-        logger.info("ルーム検索試行 %d/3: %d個のルームが見つかりました", attempt, len(rooms))
-        for room in rooms:
-            text = room.text.strip()
-            if room_name in text:
-                logger.info("%sルームが見つかりました。クリックしています...", room_name)
-                room.click()
-                return True
-        time.sleep(2)
-    return False
+            body = gen_credo_with_local_llm(idx, title)
+            logger.info("[bench %d/%d] %d. %s ／ %s（%d文字）", i + 1, n, idx, title, body, len(body))
+        except Exception as e:
+            failed += 1
+            logger.warning("[bench %d/%d] 失敗: %s", i + 1, n, e)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    runs = GEN_STATS["runs"] or 1
+    logger.info(
+        "[bench] runs=%d 1回目成功率=%.0f%% 最終手段=%d 失敗=%d p50=%.2fs max=%.2fs "
+        "(stream=%s candidates=%d constrained=%s)",
+        n, 100 * GEN_STATS["first_attempt_ok"] / runs, GEN_STATS["fallback"], failed,
+        times[len(times) // 2], times[-1],
+        OLLAMA_STREAM, GEN_CANDIDATES, OLLAMA_CONSTRAINED,
+    )
+    cache = llm_cache()
+    if cache:
+        logger.info("[bench] LLM キャッシュ: hit=%d miss=%d", cache.hits, cache.misses)
+        if cache.hits:
+            logger.warning("[bench] キャッシュ命中を含むため、成功率・所要時間はモデルの実測ではありません"
+                           "（LLM_CACHE=on を外して再計測してください）")
 
 
-# ─────────── main ─────────── #
-def main() -> None:
-    # 生成対象の抽選
-    idx, (title, _) = random.choice(list(CREDOS.items()))
+def _get_pregenerated(day: date) -> tuple[int, str, str] | None:
+    try:
+        store = PregenStore()
+    except Exception as e:
+        logger.warning("事前生成ストアを開けません（%s）→ その場で生成します", e)
+        return None
+    try:
+        return store.get(day)
+    finally:
+        store.close()
 
-    # LLM優先で生成 → 失敗時フォールバック
+
+def _consume_pregenerated(day: date) -> None:
+    """送信に成功した日の事前生成分を消す（失敗時は残し、再実行で同じ本文を使う）。"""
     try:
-        if LOCAL_LLM:
-            body = gen_credo_with_local_llm(idx, title)
-        else:
-            raise RuntimeError("LOCAL_LLM not set")
+        store = PregenStore()
     except Exception as e:
-        logger.warning("ローカルLLM生成に失敗（%s）→ フォールバック使用", e)
-        body = generate_credo_text(idx, title)
+        logger.warning("事前生成ストアを開けません（%s）→ %s の分は残ります", e, day)
+        return
+    try:
+        store.delete(day)
+    finally:
+        store.close()
+
 
+def compose_credo() -> tuple[int, str, str]:
+    """クレドを抽選し、LLM（失敗時フォールバック）で本文を生成して (番号, タイトル, 本文) を返す。
+
+    当日分が事前生成されていればそれを使う。消すのは送信成功後（_consume_pregenerated）。
+    """
+    with RUN.span("credo.select") as sp:
+        pre = _get_pregenerated(date.today())
+        if pre and not is_bad(pre[2]):
+            idx, title, body = pre
+            sp.update(idx=idx, source="pregenerated")
+            logger.info("事前生成済みの本文を使用します（%s）", date.today())
+            return idx, title, body
+
+        # 生成対象の抽選
+        idx, (title, _) = random.choice(list(CREDOS.items()))
+        sp.update(idx=idx, source="draw")
+
+    # LLM優先で生成 → 失敗時フォールバック
+    with RUN.span("llm.generate") as sp:
+        try:
+            if LOCAL_LLM:
+                body = gen_credo_with_local_llm(idx, title)
+                sp["source"] = "llm"
+            else:
+                raise RuntimeError("LOCAL_LLM not set")
+        except Exception as e:
+            logger.warning("ローカルLLM生成に失敗（%s）→ フォールバック使用", e)
+            body = generate_credo_text(idx, title)
+            sp["source"] = "fallback"
+        sp["chars"] = len(body)
+
+    return idx, title, body
+
+
+def compose_message(author: str = AUTHOR_NAME) -> str:
+    """compose_credo() の本文から投稿文を組み立てる。"""
+    return _format_message(*compose_credo(), author=author)
+
+
+def _format_message(idx: int, title: str, body: str, author: str = AUTHOR_NAME) -> str:
     message = (
         "【クレド報告】\n"
-        "福原玄\n"
+        f"{author}\n"
         f"＜クレドバリュー＞\n{idx}. {title}\n"
         f"＜気づき＞\n{body}"
     )
     logger.info("生成されたメッセージ:\n%s", message)
+    return message
+
+
+def should_skip_today() -> bool:
+    # 任意スキップ（run_if_business_day.py 側でも制御するが、直実行対策）
+    return calendar_for(PROJECT_ROOT).skip_reason(date.today()) is not None
+
+
+def _run_in_background(fn, name: str = "credo-gen") -> Future:
+    """fn をデーモンスレッドで実行する（投稿側が失敗しても終了を待たされない）。"""
+    fut: Future = Future()
+
+    def _worker():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn())
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=_worker, name=name, daemon=True).start()
+    return fut
+
+
+def _then(fut: Future, fn) -> Future:
+    """fut の結果に fn を適用した Future を返す（fut の完了時に評価）。"""
+    out: Future = Future()
+
+    def _done(f: Future) -> None:
+        try:
+            out.set_result(fn(f.result()))
+        except BaseException as e:
+            out.set_exception(e)
+
+    fut.add_done_callback(_done)
+    return out
+
+
+def post_pipelined(poster: Poster) -> None:
+    """本文生成とブラウザ起動〜ログイン〜ルーム選択を並行に進め、入力直前で合流する。"""
+    t0 = time.perf_counter()
+    fut = _run_in_background(compose_message)
+    with poster:
+        t_ready = time.perf_counter() - t0
+        logger.info("[pipeline] 投稿準備完了: %.1fs（本文生成%s）",
+                    t_ready, "済み" if fut.done() else "を待っています...")
+        message = fut.result()
+        t_gen = time.perf_counter() - t0
+        logger.info("[pipeline] 合流: %.1fs（待ち %.1fs）", max(t_ready, t_gen), max(0.0, t_gen - t_ready))
+        poster.send(message)
+    _consume_pregenerated(date.today())
+
+
+def post_fanout(accounts: dict, templates: dict, jobs: list, dry_run: bool) -> int:
+    """fanout.load_jobs() の全ジョブを投稿し（dry_run なら本文の一覧表示のみ）、失敗件数を返す。
+
+    テンプレートの本文はバックグラウンドで作り、各アカウントのログインと並行させる。
+    kind=credo は LLM の本文だけを全アカウントで共有し、署名はアカウントの name にする。
+    """
+    from fanout import render_text, report, run_jobs
+
+    bodies: dict[str, Future] = {}
+    messages: dict[tuple[str, str], Future] = {}
+    for job in jobs:
+        key = (job.template, job.account)
+        if key in messages:
+            continue
+        tpl = templates[job.template]
+        if tpl["kind"] == "credo":
+            if job.template not in bodies:
+                bodies[job.template] = _run_in_background(compose_credo)
+            author = accounts[job.account].display_name
+            messages[key] = _then(bodies[job.template], lambda c, a=author: _format_message(*c, author=a))
+        else:
+            messages[key] = _run_in_background(lambda t=tpl: render_text(t))
+    if dry_run:
+        for job in jobs:
+            logger.info("DRY RUN: %s → %s（%s）\n%s", job.account, job.room, job.template,
+                        messages[(job.template, job.account)].result())
+        return 0
+    failed = report(run_jobs(accounts, jobs, messages))
+    # 事前生成分は credo の全ジョブが送れたときだけ消す（失敗分の再実行で同じ本文を使う）
+    if bodies and all(job.ok for job in jobs if templates[job.template]["kind"] == "credo"):
+        _consume_pregenerated(date.today())
+    return failed
+
+
+def run_mode(args: argparse.Namespace) -> str:
+    if args.warmup:
+        return "warmup"
+    if args.bench_gen:
+        return "bench"
+    if args.pregenerate:
+        return "pregenerate"
+    if args.dry_run:
+        return "dry_run"
+    if args.jobs:
+        return "fanout"
+    return "pipeline" if args.pipeline else "post"
+
+
+def main(argv: list[str] | None = None) -> None:
+    global USE_LLM_CACHE
+    args = parse_args(argv)
+    mode = run_mode(args)
+    USE_LLM_CACHE = LLM_CACHE_MODE == "on" or (LLM_CACHE_MODE == "auto" and mode == "dry_run")
 
-    # dry-run ならここで終わり
-    logger.info("ブラウザを起動しています...")
     logger.info("=== using Python executable: %s ===", sys.executable)
-    logger.info("=== ENV CHROMEDRIVER_PATH: %s", CHROMEDRIVER_PATH or "(auto)")
-    logger.info("=== ENV CHROME_BINARY: %s", CHROME_BINARY or "(default)")
+    logger.info("=== POSTER: %s", args.poster)
     logger.info("=== 実行開始: %s", date.today())
-    if args.dry_run:
-        logger.info("DRY RUN: 投稿は行いません。UI操作はここで終了します。")
+    RUN.set(mode=mode, poster=args.poster, model=LOCAL_LLM, outcome="error")
+
+    if args.warmup:
+        if not LOCAL_LLM:
+            logger.error("LOCAL_LLM が未設定のため warmup できません")
+            return
+        with RUN.span("llm.warmup"):
+            ollama_client().warmup()
+        RUN.set(outcome="done")
         return
 
-    # 任意スキップ（run_if_business_day.py 側でも制御するが、直実行対策）
-    today = date.today().strftime("%Y-%m-%d")
-    skip_env = {d.strip() for d in os.getenv("SKIP_DATES", "").split(",") if d.strip()}
-    if today in skip_env or date.today().weekday() >= 5 or jpholiday.is_holiday(date.today()):
+    if args.bench_gen:
+        bench_generation(args.bench_gen)
+        RUN.set(outcome="done")
+        return
+
+    if args.pregenerate:
+        saved = pregenerate(args.pregenerate)
+        logger.info("事前生成: %d 件を保存しました", saved)
+        RUN.set(outcome="done", pregenerated=saved)
+        return
+
+    # 投稿する経路は、生成やブラウザ準備より先にスキップ判定を行う
+    if not args.dry_run and should_skip_today():
         logger.info("本日はクレド報告をスキップします。")
+        RUN.set(outcome="skipped")
         return
 
-    driver = None
-    try:
-        driver = build_driver()
-        wait = WebDriverWait(driver, DEFAULT_WAIT_SEC)
-
-        # 1) ログインID入力
-        logger.info("LINE WORKSログインページにアクセスしています...")
-        driver.get(LOGIN_URL)
-
-        id_inp = _find_first(wait, [
-            (By.CSS_SELECTOR, "input[name='loginId']"),
-            (By.CSS_SELECTOR, "input[type='text']"),
-        ])
-        logger.info("ユーザーIDを入力しています...")
-        id_inp.clear()
-        id_inp.send_keys(LW_ID)
-
-        # 2) 次へ or ログイン
-        logger.info("次へボタンをクリックしています...")
-        btn = _find_first(wait, [
-            (By.XPATH, "//button[contains(normalize-space(.),'次へ')]"),
-            (By.XPATH, "//button[contains(normalize-space(.),'ログイン')]"),
-            (By.CSS_SELECTOR, "button[type='submit']"),
-        ])
-        btn.click()
-
-        # 3) パスワード
-        logger.info("パスワード入力画面を探しています...")
-        switch_to_iframe_with_form(driver, wait)
-        logger.info("パスワードを入力しています...")
-        pw = _find_first(wait, [(By.CSS_SELECTOR, "input[type='password']")])
-        pw.clear()
-        pw.send_keys(LW_PASS)
-        logger.info("ログインボタンをクリックしています...")
-        btn = _find_first(wait, [
-            (By.XPATH, "//button[contains(normalize-space(.),'ログイン')]"),
-            (By.CSS_SELECTOR, "button[type='submit']"),
-        ])
-        btn.click()
-        driver.switch_to.default_content()
-
-        # 4) Talk画面遷移
-        logger.info("LINE WORKSトークページに移動しています...")
+    if args.jobs:
+        if args.poster != "selenium":
+            logger.error("--jobs は selenium バックエンドのみ対応しています")
+            sys.exit(1)
+        from fanout import load_jobs
+        try:
+            accounts, templates, jobs = load_jobs(args.jobs, check_env=not args.dry_run)
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.error("ジョブ定義を読み込めません: %s", e)
+            sys.exit(1)
+        try:
+            failed = post_fanout(accounts, templates, jobs, args.dry_run)
+        except KeyboardInterrupt:
+            logger.warning("ユーザーにより中断されました（Ctrl+C）")
+            RUN.set(outcome="interrupted")
+            return
+        if args.dry_run:
+            RUN.set(outcome="done")
+            return
+        if failed:
+            RUN.set(outcome="partial" if failed < len(jobs) else "error")
+            sys.exit(1)
+        RUN.set(outcome="sent")
+        logger.info("全ジョブの送信完了🎉")
+        return
+
+    poster = None
+    if not args.dry_run:
+        poster = make_poster(args.poster, ROOM_NAME)
         try:
-            talk_link = WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
-                (By.XPATH, "//a[contains(@href,'talk.worksmobile.com')]")
-            ))
-            talk_link.click()
-            logger.info("トークページリンクをクリックしました")
-        except TimeoutException:
-            logger.warning("トークページリンクが見つからない場合の代替処理")
-            driver.get(TALK_URL)
-            logger.info("直接トークページにアクセスしました")
-
-        wait_talk_app_ready(driver, wait)
-
-        # 5) チャンネル選択
-        if not open_room(driver, wait, ROOM_NAME):
-            raise TimeoutException(f"チャンネル {ROOM_NAME} をUIから選択できませんでした")
-
-        # 6) 投稿
-        logger.info("メッセージ入力欄を探しています...")
-        editor = wait.until(EC.presence_of_element_located(
-            (By.CSS_SELECTOR, "div.editor_input.message-input")
-        ))
-        logger.info("メッセージ入力欄が見つかりました: div.editor_input.message-input")
-        logger.info("メッセージを入力しています...")
-        editor.click()
-        editor.send_keys(message)
-
-        logger.info("Ctrl+Enterでメッセージを送信しています...")
-        ActionChains(driver).key_down(Keys.CONTROL).send_keys(Keys.ENTER).key_up(Keys.CONTROL).perform()
+            poster.check_config()
+        except RuntimeError as e:
+            logger.error("%s", e)
+            sys.exit(1)
 
+    if args.pipeline and poster:
         try:
-            WebDriverWait(driver, 10).until(EC.staleness_of(editor))
-        except TimeoutException:
-            pass
+            post_pipelined(poster)
+            logger.info("メッセージ送信完了🎉")
+            RUN.set(outcome="sent")
+        except KeyboardInterrupt:
+            logger.warning("ユーザーにより中断されました（Ctrl+C）")
+            RUN.set(outcome="interrupted")
+        except Exception as e:
+            logger.exception("❌ 予期せぬ例外: %s", e)
+            raise
+        return
 
-        logger.info("メッセージ送信完了🎉")
+    message = compose_message()
+
+    # dry-run ならここで終わり
+    if args.dry_run:
+        logger.info("DRY RUN: 投稿は行いません。UI操作はここで終了します。")
+        RUN.set(outcome="done")
+        return
 
+    try:
+        with poster:
+            poster.send(message)
+        _consume_pregenerated(date.today())
+        logger.info("メッセージ送信完了🎉")
+        RUN.set(outcome="sent")
     except KeyboardInterrupt:
         logger.warning("ユーザーにより中断されました（Ctrl+C）")
+        RUN.set(outcome="interrupted")
     except Exception as e:
         logger.exception("❌ 予期せぬ例外: %s", e)
-        # デバッグ用ダンプ
-        try:
-            png = "/tmp/cred_error.png"
-            html = "/tmp/cred_error.html"
-            driver.save_screenshot(png)
-            Path(html).write_text(driver.page_source, encoding="utf-8")
-            logger.error("デバッグ用に %s と %s を保存しました", png, html)
-        except Exception:
-            pass
         raise
-    finally:
-        try:
-            if driver:
-                driver.quit()
-        except Exception:
-            pass
 
 
 if __name__ == "__main__":
-    main()
-
+    try:
+        main()
+    finally:
+        # Prometheus の textfile は本番の投稿実行だけで更新する（--help 等で mode 未確定なら記録しない）
+        if "mode" in RUN.attrs:
+            RUN.write(prom=RUN.attrs["mode"] in ("post", "pipeline", "fanout"))
@@ -0,0 +1,105 @@
+"""
+llm_cache.py – LLM 応答のコンテンツアドレス型キャッシュ（SQLite）
+
+(モデル, プロンプト, 生成オプション) の SHA-256 をキーに応答文字列を保存する。
+TTL を過ぎたものは読まずに捨て、件数が上限を超えたら最終参照が古い順に削除（LRU）。
+
+dry-run・ベンチ・開発用。本番投稿は常に新しい文を生成するよう、呼び出し側で
+LLM_CACHE=off（または auto の既定動作）によりバイパスする。
+  LLM_CACHE=auto … lineworks_cred_llm.py は --dry-run のときだけ、ask.py は --cache か --temp 0 のときだけ
+                   （--bench-gen はモデルそのものを測るため使わない）
+  LLM_CACHE=on   … 常に使用
+  LLM_CACHE=off  … 使用しない
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "llm_cache.sqlite3"
+DEFAULT_TTL_SEC = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key         TEXT PRIMARY KEY,
+    model       TEXT NOT NULL,
+    response    TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+def cache_mode() -> str:
+    mode = os.getenv("LLM_CACHE", "auto").strip().lower()
+    return mode if mode in ("auto", "on", "off") else "auto"
+
+
+def cache_key(model: str, prompt: str, options: dict | None = None) -> str:
+    blob = json.dumps({"model": model, "prompt": prompt, "options": options or {}},
+                      sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """スレッド間で共有できる SQLite キャッシュ（書き込みはロックで直列化）。"""
+
+    def __init__(self, path: Path | str | None = None,
+                 ttl_sec: float | None = None, max_entries: int | None = None):
+        self.path = Path(path or os.getenv("LLM_CACHE_PATH") or DEFAULT_CACHE_PATH)
+        self.ttl_sec = ttl_sec if ttl_sec is not None else float(os.getenv("LLM_CACHE_TTL_SEC", DEFAULT_TTL_SEC))
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl_sec:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self.conn.commit()
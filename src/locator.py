@@ -0,0 +1,188 @@
+"""
+locator.py – Selenium 要素探索ヘルパ
+
+複数の (By, selector) 候補を1つの待機ループでまとめてポーリングし、
+最初に現れたものを返す。候補ごとに全タイムアウトを消費しないため、
+フォールバック候補が使われる日でも待ち時間が増えない。
+
+LocatorCache は各ステップで実際にヒットしたセレクタ（とパスワード欄の
+iframe 添字）をディスクに保存し、次回はそれを先頭で試す。ヒットしなく
+なったセレクタは、その回に勝った候補へ置き換えて降格する。
+ルーム名 → チャンネルID / 直リンク URL も同じファイルに保持する。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+POLL_SEC = 0.25
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "locators.json"
+
+logger = logging.getLogger(__name__)
+
+
+class LocatorCache:
+    """ステップ名 → 前回ヒットしたセレクタ / iframe 添字 を保持する JSON キャッシュ。
+
+    更新と保存はロックで直列化するため、複数セッション（fanout）で1つを共有してよい。
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = Path(path or os.getenv("LOCATOR_CACHE_PATH") or DEFAULT_CACHE_PATH)
+        self.data: dict = {"steps": {}, "frames": {}, "rooms": {}}
+        self._dirty = False
+        self._lock = threading.RLock()
+        try:
+            loaded = json.loads(self.path.read_text(encoding="utf-8"))
+            if isinstance(loaded, dict):
+                self.data.update(loaded)
+        except (OSError, ValueError):
+            pass
+        self.data.setdefault("rooms", {})
+
+    def order(self, step: str, selectors: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """前回ヒットしたセレクタを先頭に並べ替えた候補リストを返す。"""
+        hit = self.data["steps"].get(step)
+        if not hit:
+            return list(selectors)
+        key = (hit["by"], hit["sel"])
+        return [key] + [s for s in selectors if s != key] if key in selectors else list(selectors)
+
+    def record(self, step: str, selector: tuple[str, str]) -> None:
+        """ヒットしたセレクタを記録する。前回と異なれば旧セレクタは降格（置換）。"""
+        by, sel = selector
+        with self._lock:
+            prev = self.data["steps"].get(step)
+            if prev and (prev["by"], prev["sel"]) == (by, sel):
+                prev["hits"] = prev.get("hits", 0) + 1
+            else:
+                if prev:
+                    logger.info("locator cache: %s を降格 → %s", prev["sel"], sel)
+                self.data["steps"][step] = {"by": by, "sel": sel, "hits": 1}
+            self._dirty = True
+
+    def frame_index(self, step: str) -> int | None:
+        return self.data["frames"].get(step)
+
+    def record_frame(self, step: str, index: int | None) -> None:
+        with self._lock:
+            if self.data["frames"].get(step) != index:
+                self.data["frames"][step] = index
+                self._dirty = True
+
+    def room(self, name: str) -> dict | None:
+        """キャッシュ済みの {"channel_id", "url"} を返す。"""
+        return self.data["rooms"].get(name)
+
+    def record_room(self, name: str, channel_id: str, url: str) -> None:
+        entry = {"channel_id": channel_id, "url": url}
+        with self._lock:
+            if self.data["rooms"].get(name) != entry:
+                self.data["rooms"][name] = entry
+                self._dirty = True
+
+    def forget_room(self, name: str) -> None:
+        with self._lock:
+            if self.data["rooms"].pop(name, None) is not None:
+                self._dirty = True
+
+    def save(self) -> None:
+        """変更があればアトミックに書き出す（失敗しても投稿処理は止めない）。"""
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding="utf-8")
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except OSError as e:
+                logger.warning("locator cache を保存できませんでした: %s", e)
+
+
+def find_first(
+    driver: WebDriver,
+    selectors: list[tuple[str, str]],
+    timeout: float,
+    poll: float = POLL_SEC,
+    cache: LocatorCache | None = None,
+    step: str | None = None,
+) -> tuple[WebElement, int]:
+    """候補を同時にポーリングし、最初に見つかった要素と候補の添字を返す。
+
+    1回のポーリングでは候補を先頭から順に調べるため、同時に複数が
+    存在する場合はリストの優先順位が保たれる。cache と step を渡すと
+    前回ヒットしたセレクタを最優先で試し、結果を記録する。
+    返す添字は常に呼び出し元の selectors に対するもの。
+    """
+    ordered = cache.order(step, selectors) if cache and step else list(selectors)
+
+    def _probe(d: WebDriver):
+        for by, sel in ordered:
+            els = d.find_elements(by, sel)
+            if els:
+                return els[0], (by, sel)
+        return False
+
+    try:
+        el, hit = WebDriverWait(driver, timeout, poll_frequency=poll).until(_probe)
+    except TimeoutException:
+        tried = ", ".join(sel for _, sel in selectors)
+        raise TimeoutException(f"{timeout:g}s 以内に要素が見つかりませんでした: {tried}")
+    if cache and step:
+        cache.record(step, hit)
+    return el, list(selectors).index(hit)
+
+
+def switch_to_iframe_with_form(
+    driver: WebDriver,
+    timeout: float,
+    poll: float = POLL_SEC,
+    cache: LocatorCache | None = None,
+    step: str = "password_frame",
+) -> int | None:
+    """パスワード入力欄を含む iframe を全フレーム同時に探して切り替える。
+
+    トップ文書に入力欄があれば切り替えずに None を返す。
+    見つかった場合はフレームの添字を返す。期限切れ時は default_content に戻して None。
+    cache があれば前回の iframe 添字から試す。
+    """
+    preferred = cache.frame_index(step) if cache else None
+
+    def _probe(d: WebDriver):
+        d.switch_to.default_content()
+        if d.find_elements(By.CSS_SELECTOR, "input[type='password']"):
+            return ("top", None)
+        indices = list(range(len(d.find_elements(By.TAG_NAME, "iframe"))))
+        if preferred in indices:
+            indices.remove(preferred)
+            indices.insert(0, preferred)
+        for i in indices:
+            try:
+                d.switch_to.frame(i)
+                if d.find_elements(By.CSS_SELECTOR, "input[type='password']"):
+                    return ("frame", i)
+            except WebDriverException:
+                pass
+            d.switch_to.default_content()
+        return False
+
+    try:
+        _, index = WebDriverWait(driver, timeout, poll_frequency=poll).until(_probe)
+        if cache:
+            cache.record_frame(step, index)
+        return index
+    except TimeoutException:
+        driver.switch_to.default_content()
+        return None
@@ -0,0 +1,245 @@
+"""
+lw_botapi.py – LINE WORKS Bot API による投稿（ブラウザ不要のバックエンド）
+
+API 2.0 のサービスアカウント認証（JWT → アクセストークン）でトークンを取得し、
+Bot からチャンネルへテキストを送信する。
+
+- トークンはメモリと .cache/lw_token.json に保持し、期限 60 秒前まで再利用
+- requests.Session で接続を keep-alive 再利用
+- 429 / 5xx / 接続エラーは指数バックオフで再試行、401 はトークンを取り直して1回だけ再送
+- LW_API_BASE / LW_AUTH_URL を差し替えればローカルのスタブ HTTP サーバで検証できる
+
+JWT 署名には PyJWT[crypto] が必要（LW_BOT_ACCESS_TOKEN で発行済みトークンを渡す場合は不要）。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import RUN
+from posters import Poster
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = "https://www.worksapis.com/v1.0"
+DEFAULT_AUTH_URL = "https://auth.worksmobile.com/oauth2/v2.0/token"
+DEFAULT_TOKEN_CACHE = Path(__file__).resolve().parent.parent / ".cache" / "lw_token.json"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 冪等でない POST（メッセージ送信）は「処理されていない」と分かる応答だけ再送する（二重投稿防止）
+UNPROCESSED_STATUS = {429, 503}
+MAX_RETRY_AFTER = 30.0  # Retry-After がこれより長くても待つのはここまで
+
+
+def _retry_after(value: str | None, default: float) -> float:
+    """Retry-After（秒数 or HTTP-date）を待ち秒数にする。読めなければ default、上限は MAX_RETRY_AFTER。"""
+    if not value:
+        return default
+    try:
+        wait = float(value)
+    except ValueError:
+        try:
+            wait = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, OverflowError):
+            return default
+    if wait != wait:  # "nan"
+        return default
+    return min(max(wait, 0.0), MAX_RETRY_AFTER)
+
+
+class BotApiPoster(Poster):
+    """Bot API でチャンネルにテキストを送る。"""
+
+    name = "bot"
+
+    def __init__(
+        self,
+        bot_id: str,
+        channel_id: str,
+        client_id: str = "",
+        client_secret: str = "",
+        service_account: str = "",
+        private_key_path: str = "",
+        access_token: str = "",
+        api_base: str = DEFAULT_API_BASE,
+        auth_url: str = DEFAULT_AUTH_URL,
+        token_cache: Path | None = DEFAULT_TOKEN_CACHE,
+        max_retries: int = 4,
+        timeout: float = 10.0,
+    ):
+        self.bot_id = bot_id
+        self.channel_id = channel_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.service_account = service_account
+        self.private_key_path = private_key_path
+        self.static_token = access_token
+        self.api_base = api_base.rstrip("/")
+        self.auth_url = auth_url
+        self.token_cache = token_cache
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session: requests.Session | None = None
+        self._token: str = ""
+        self._token_exp: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "BotApiPoster":
+        cache = os.getenv("LW_TOKEN_CACHE", "")
+        return cls(
+            bot_id=os.getenv("LW_BOT_ID", ""),
+            channel_id=os.getenv("LW_CHANNEL_ID", ""),
+            client_id=os.getenv("LW_CLIENT_ID", ""),
+            client_secret=os.getenv("LW_CLIENT_SECRET", ""),
+            service_account=os.getenv("LW_SERVICE_ACCOUNT", ""),
+            private_key_path=os.getenv("LW_PRIVATE_KEY_PATH", ""),
+            access_token=os.getenv("LW_BOT_ACCESS_TOKEN", ""),
+            api_base=os.getenv("LW_API_BASE", DEFAULT_API_BASE),
+            auth_url=os.getenv("LW_AUTH_URL", DEFAULT_AUTH_URL),
+            token_cache=Path(cache) if cache else DEFAULT_TOKEN_CACHE,
+        )
+
+    def check_config(self) -> None:
+        missing = [k for k, v in (("LW_BOT_ID", self.bot_id), ("LW_CHANNEL_ID", self.channel_id)) if not v]
+        if not self.static_token:
+            missing += [k for k, v in (
+                ("LW_CLIENT_ID", self.client_id),
+                ("LW_CLIENT_SECRET", self.client_secret),
+                ("LW_SERVICE_ACCOUNT", self.service_account),
+                ("LW_PRIVATE_KEY_PATH", self.private_key_path),
+            ) if not v]
+        if missing:
+            raise RuntimeError(f"Bot API の設定が不足しています: {', '.join(missing)}")
+
+    # ─────────── 接続・トークン ─────────── #
+    def open(self) -> None:
+        self.check_config()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        with RUN.span("bot.token"):
+            self._access_token()
+
+    def close(self, exc: BaseException | None = None) -> None:
+        if self.session:
+            self.session.close()
+            self.session = None
+
+    def _load_cached_token(self) -> bool:
+        if not self.token_cache:
+            return False
+        try:
+            data = json.loads(self.token_cache.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if data.get("client_id") != self.client_id or data.get("expires_at", 0) - 60 <= time.time():
+            return False
+        self._token, self._token_exp = data["access_token"], float(data["expires_at"])
+        return True
+
+    def _save_cached_token(self) -> None:
+        if not self.token_cache:
+            return
+        try:
+            self.token_cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.token_cache.with_suffix(".tmp")
+            tmp.write_text(json.dumps({
+                "client_id": self.client_id,
+                "access_token": self._token,
+                "expires_at": self._token_exp,
+            }), encoding="utf-8")
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.token_cache)
+        except OSError as e:
+            logger.warning("アクセストークンをキャッシュできませんでした: %s", e)
+
+    def _issue_token(self) -> None:
+        """サービスアカウントの JWT でアクセストークンを発行する。"""
+        try:
+            import jwt  # PyJWT[crypto]
+        except ImportError as e:
+            raise RuntimeError("JWT 署名に PyJWT[crypto] が必要です（pip install 'pyjwt[crypto]'）") from e
+
+        now = int(time.time())
+        assertion = jwt.encode(
+            {"iss": self.client_id, "sub": self.service_account, "iat": now, "exp": now + 3600},
+            Path(self.private_key_path).expanduser().read_text(encoding="utf-8"),
+            algorithm="RS256",
+        )
+        r = self._request("POST", self.auth_url, data={
+            "assertion": assertion,
+            "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "scope": "bot",
+        }, auth=False, idempotent=True)
+        body = r.json()
+        self._token = body["access_token"]
+        self._token_exp = time.time() + int(body.get("expires_in", 3600))
+        self._save_cached_token()
+        logger.info("Bot API のアクセストークンを発行しました")
+
+    def _access_token(self, refresh: bool = False) -> str:
+        if self.static_token:
+            return self.static_token
+        if not refresh and self._token and self._token_exp - 60 > time.time():
+            return self._token
+        if refresh or not self._load_cached_token():
+            self._issue_token()
+        return self._token
+
+    # ─────────── HTTP ─────────── #
+    def _request(self, method: str, url: str, auth: bool = True, idempotent: bool = False,
+                 **kw) -> requests.Response:
+        """再試行付きリクエスト。401 はトークンを取り直して1回だけ再送する。
+
+        idempotent でなければ、サーバーが受け付けた可能性のある失敗（読み取りタイムアウト、
+        500/502/504）は再送せずにそのまま失敗させる。接続失敗・429・503 だけ再送する。
+        """
+        retry_status = RETRY_STATUS if idempotent else UNPROCESSED_STATUS
+        refreshed = False
+        delay = 0.5
+        extra_headers = kw.pop("headers", {})
+        for attempt in range(1, self.max_retries + 1):
+            headers = dict(extra_headers)
+            if auth:
+                headers["Authorization"] = f"Bearer {self._access_token()}"
+            try:
+                r = self.session.request(method, url, headers=headers, timeout=self.timeout, **kw)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                sent = isinstance(e, requests.Timeout) and not isinstance(e, requests.ConnectTimeout)
+                if attempt == self.max_retries or (sent and not idempotent):
+                    raise
+                logger.warning("Bot API 接続エラー（%s）→ %.1fs 後に再試行 %d/%d", e, delay, attempt, self.max_retries)
+                time.sleep(delay)
+                delay *= 2
+                continue
+            if r.status_code == 401 and auth and not refreshed and not self.static_token:
+                refreshed = True
+                self._access_token(refresh=True)
+                continue
+            if r.status_code in retry_status and attempt < self.max_retries:
+                wait = _retry_after(r.headers.get("Retry-After"), delay)
+                logger.warning("Bot API %d → %.1fs 後に再試行 %d/%d", r.status_code, wait, attempt, self.max_retries)
+                time.sleep(wait)
+                delay *= 2
+                continue
+            r.raise_for_status()
+            return r
+        r.raise_for_status()
+        return r
+
+    def send(self, message: str) -> None:
+        url = f"{self.api_base}/bots/{self.bot_id}/channels/{self.channel_id}/messages"
+        t0 = time.perf_counter()
+        with RUN.span("message.send", backend="bot"):
+            self._request("POST", url, json={"content": {"type": "text", "text": message}})
+        logger.info("Bot API で送信しました（%.0fms）", (time.perf_counter() - t0) * 1000)
@@ -0,0 +1,519 @@
+"""
+lw_selenium.py – Headless Chrome による LINE WORKS 投稿（Selenium バックエンド）
+
+ブラウザの起動／常駐ブラウザへの接続、ログイン、ルーム選択、入力・送信を担う。
+posters.make_poster("selenium") から SeleniumPoster として使う。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from browser_daemon import debugger_alive
+from locator import LocatorCache, find_first, switch_to_iframe_with_form
+from metrics import RUN
+from posters import Poster
+
+logger = logging.getLogger(__name__)
+
+
+# ─────────── 定数 ─────────── #
+LOGIN_URL = (
+    "https://auth.worksmobile.com/login/login"
+    "?accessUrl=https%3A%2F%2Ftalk.worksmobile.com%2F%23%2F"
+)
+TALK_URL = "https://talk.worksmobile.com/#/"
+DEFAULT_WAIT_SEC = 240
+# ステップ別の待機上限（秒）。候補は同時にポーリングするため、ここが各ステップの最大待ち時間
+# STEP_TIMEOUTS="login_id=90,editor=120" のように環境変数で上書き可
+STEP_TIMEOUT_SEC = {
+    "login_id": 60,
+    "login_next": 30,
+    "password_frame": 60,
+    "password": 30,
+    "login_submit": 30,
+    "talk_ready": DEFAULT_WAIT_SEC,
+    "session_check": 30,
+    "room_list": 60,
+    "room_direct": 20,
+    "room_url": 2,  # クリック後に URL がルーム固有に変わるのを待つ（直リンク記録用、待てなくても投稿は続ける）
+    "editor": 60,
+}
+
+# ─────────── Chrome 設定 ─────────── #
+CHROME_BINARY = os.getenv("CHROME_BINARY", "")
+CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "")
+HEADLESS = os.getenv("HEADLESS", "1")  # "0" で画面表示
+# 指定するとログイン済みプロファイルを --user-data-dir で再利用（未指定なら毎回まっさら）
+CHROME_PROFILE_DIR = os.getenv("CHROME_PROFILE_DIR", "").strip()
+# browser_daemon.py が常駐していれば、その Chrome に接続（例: 127.0.0.1:9222）
+CHROME_DEBUGGER_ADDRESS = os.getenv("CHROME_DEBUGGER_ADDRESS", "").strip()
+# "1" で軽量モード（eager 読み込み + 画像/メディア/フォント/計測タグを CDP でブロック）
+LEAN_PAGE_LOAD = os.getenv("LEAN_PAGE_LOAD", "0") == "1"
+# メッセージ入力方式: bulk=JS で一括挿入して検証（不一致なら keys に退避） / keys=1文字ずつ send_keys
+INPUT_MODE = os.getenv("INPUT_MODE", "bulk").strip().lower()
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico", "*.bmp",
+    "*.mp4", "*.webm", "*.mp3", "*.m4a", "*.ogg", "*.wav",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*hotjar.com*", "*clarity.ms*",
+]
+LEAN_CHROME_ARGS = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--mute-audio",
+    "--no-first-run",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-features=Translate,MediaRouter,OptimizationHints",
+]
+
+for _tok in os.getenv("STEP_TIMEOUTS", "").split(","):
+    _step, _, _sec = _tok.partition("=")
+    if _step.strip() in STEP_TIMEOUT_SEC and _sec.strip():
+        STEP_TIMEOUT_SEC[_step.strip()] = float(_sec)
+
+
+# ─────────── Selenium ヘルパ ─────────── #
+def _apply_lean(opts: Options) -> None:
+    opts.page_load_strategy = "eager"
+    for arg in LEAN_CHROME_ARGS:
+        opts.add_argument(arg)
+    opts.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
+
+def _block_heavy_resources(driver: webdriver.Chrome) -> None:
+    """CDP で不要リソースの URL をブロックする（失敗しても通常読み込みで続行）。"""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+        logger.info("軽量モード: %d パターンの URL をブロックします", len(LEAN_BLOCKED_URLS))
+    except WebDriverException as e:
+        logger.warning("軽量モードの URL ブロックを設定できませんでした: %s", e.msg)
+
+
+def build_driver(profile_dir: str = CHROME_PROFILE_DIR) -> webdriver.Chrome:
+    opts = Options()
+    if LEAN_PAGE_LOAD:
+        _apply_lean(opts)
+    if HEADLESS != "0":
+        opts.add_argument("--headless=new")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--window-size=1280,900")
+    if profile_dir:
+        profile = Path(profile_dir).expanduser().resolve()
+        profile.mkdir(parents=True, exist_ok=True)
+        opts.add_argument(f"--user-data-dir={profile}")
+    if CHROME_BINARY:
+        opts.binary_location = CHROME_BINARY
+
+    if CHROMEDRIVER_PATH and Path(CHROMEDRIVER_PATH).is_file():
+        service = Service(executable_path=CHROMEDRIVER_PATH, start_timeout=240)
+        driver = webdriver.Chrome(service=service, options=opts)
+    else:
+        driver = webdriver.Chrome(options=opts)  # Selenium Manager に自動解決
+
+    try:
+        driver.set_page_load_timeout(180)
+    except Exception:
+        pass
+    if LEAN_PAGE_LOAD:
+        _block_heavy_resources(driver)
+    return driver
+
+
+def attach_driver(address: str) -> webdriver.Chrome:
+    """常駐 Chrome に debuggerAddress で接続し、Talk タブを前面にする。"""
+    opts = Options()
+    if LEAN_PAGE_LOAD:
+        opts.page_load_strategy = "eager"
+    opts.add_experimental_option("debuggerAddress", address)
+    if CHROMEDRIVER_PATH and Path(CHROMEDRIVER_PATH).is_file():
+        driver = webdriver.Chrome(service=Service(executable_path=CHROMEDRIVER_PATH), options=opts)
+    else:
+        driver = webdriver.Chrome(options=opts)
+    for handle in driver.window_handles:
+        driver.switch_to.window(handle)
+        if "talk.worksmobile.com" in driver.current_url:
+            break
+    if LEAN_PAGE_LOAD:
+        _block_heavy_resources(driver)
+    return driver
+
+
+def connect_driver(debugger_address: str = CHROME_DEBUGGER_ADDRESS,
+                   profile_dir: str = CHROME_PROFILE_DIR) -> tuple[webdriver.Chrome, bool]:
+    """常駐ブラウザがあれば接続、無ければコールド起動。(driver, attached) を返す。"""
+    if debugger_address:
+        if debugger_alive(debugger_address):
+            try:
+                driver = attach_driver(debugger_address)
+                logger.info("常駐ブラウザに接続しました: %s", debugger_address)
+                return driver, True
+            except WebDriverException as e:
+                logger.warning("常駐ブラウザへの接続に失敗（%s）→ コールド起動します", e.msg)
+        else:
+            logger.warning("常駐ブラウザ %s が応答しません → コールド起動します", debugger_address)
+    return build_driver(profile_dir), False
+
+
+def _find_first(driver: webdriver.Chrome, step: str, selectors: list[tuple[By, str]],
+                cache: LocatorCache | None = None):
+    """ステップの待機上限内で候補を同時に探し、最初に見つかった要素を返す。"""
+    el, _ = find_first(driver, selectors, STEP_TIMEOUT_SEC[step], cache=cache, step=step)
+    return el
+
+
+def wait_talk_app_ready(driver: webdriver.Chrome, wait: WebDriverWait | None = None,
+                        fail_on_login_page: bool = False):
+    wait = wait or WebDriverWait(driver, STEP_TIMEOUT_SEC["talk_ready"])
+    # DOM 完了
+    wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
+    # 入力欄か検索欄のどちらかが出ればOK
+    ready = [
+        EC.presence_of_element_located((By.CSS_SELECTOR, "div.editor_input.message-input")),
+        EC.presence_of_element_located((By.CSS_SELECTOR, "input[placeholder*='検索']")),
+    ]
+    if not fail_on_login_page:
+        wait.until(EC.any_of(*ready))
+        return
+    # セッション確認時はログイン画面へのリダイレクトを検知したら待たずに失敗
+    login_page = EC.presence_of_element_located((By.CSS_SELECTOR, "input[name='loginId']"))
+    wait.until(EC.any_of(*ready, login_page))
+    if driver.find_elements(By.CSS_SELECTOR, "input[name='loginId']"):
+        raise TimeoutException("ログイン画面にリダイレクトされました")
+
+
+def login_with_credentials(driver: webdriver.Chrome, lw_id: str, lw_pass: str,
+                           cache: LocatorCache | None = None) -> None:
+    """LOGIN_URL → ID → iframe 内パスワード → Talk 画面 の通常ログイン。"""
+    # ログインID入力
+    logger.info("LINE WORKSログインページにアクセスしています...")
+    with RUN.span("login.page"):
+        driver.get(LOGIN_URL)
+
+    with RUN.span("login.id"):
+        id_inp = _find_first(driver, "login_id", [
+            (By.CSS_SELECTOR, "input[name='loginId']"),
+            (By.CSS_SELECTOR, "input[type='text']"),
+        ], cache)
+        logger.info("ユーザーIDを入力しています...")
+        id_inp.clear()
+        id_inp.send_keys(lw_id)
+
+    # 次へ or ログイン
+    logger.info("次へボタンをクリックしています...")
+    with RUN.span("login.next"):
+        btn = _find_first(driver, "login_next", [
+            (By.XPATH, "//button[contains(normalize-space(.),'次へ')]"),
+            (By.XPATH, "//button[contains(normalize-space(.),'ログイン')]"),
+            (By.CSS_SELECTOR, "button[type='submit']"),
+        ], cache)
+        btn.click()
+
+    # パスワード
+    logger.info("パスワード入力画面を探しています...")
+    with RUN.span("login.password_frame"):
+        switch_to_iframe_with_form(driver, STEP_TIMEOUT_SEC["password_frame"], cache=cache)
+    logger.info("パスワードを入力しています...")
+    with RUN.span("login.password"):
+        pw = _find_first(driver, "password", [(By.CSS_SELECTOR, "input[type='password']")], cache)
+        pw.clear()
+        pw.send_keys(lw_pass)
+    logger.info("ログインボタンをクリックしています...")
+    with RUN.span("login.submit"):
+        btn = _find_first(driver, "login_submit", [
+            (By.XPATH, "//button[contains(normalize-space(.),'ログイン')]"),
+            (By.CSS_SELECTOR, "button[type='submit']"),
+        ], cache)
+        btn.click()
+        driver.switch_to.default_content()
+
+    # Talk画面遷移
+    logger.info("LINE WORKSトークページに移動しています...")
+    with RUN.span("login.talk_ready"):
+        try:
+            talk_link = WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
+                (By.XPATH, "//a[contains(@href,'talk.worksmobile.com')]")
+            ))
+            talk_link.click()
+            logger.info("トークページリンクをクリックしました")
+        except TimeoutException:
+            logger.warning("トークページリンクが見つからない場合の代替処理")
+            driver.get(TALK_URL)
+            logger.info("直接トークページにアクセスしました")
+
+        wait_talk_app_ready(driver)
+
+
+def session_is_valid(driver: webdriver.Chrome) -> bool:
+    """TALK_URL へ直接アクセスし、保存済みセッションで Talk が開けるかを確認する。"""
+    logger.info("保存済みセッションでトークページに直接アクセスしています...")
+    with RUN.span("login.session_check") as sp:
+        driver.get(TALK_URL)
+        try:
+            wait_talk_app_ready(driver, WebDriverWait(driver, STEP_TIMEOUT_SEC["session_check"]),
+                                fail_on_login_page=True)
+            sp["valid"] = True
+            return True
+        except TimeoutException as e:
+            logger.info("保存済みセッションは無効です（%s）→ 通常ログインにフォールバック", e.msg or "timeout")
+            driver.switch_to.default_content()
+            sp["valid"] = False
+            return False
+
+
+_BULK_INSERT_JS = """
+const el = arguments[0], text = arguments[1];
+el.focus();
+const range = document.createRange();
+range.selectNodeContents(el);
+const sel = window.getSelection();
+sel.removeAllRanges();
+sel.addRange(range);
+if (text === "") { document.execCommand("delete"); }
+else { document.execCommand("insertText", false, text); }
+return el.innerText;
+"""
+
+
+def _normalize_editor_text(text: str) -> str:
+    text = text.replace("\r\n", "\n").replace("\u00a0", " ")
+    return re.sub(r"\n+", "\n", text).strip()
+
+
+def input_message(driver: webdriver.Chrome, editor, message: str) -> None:
+    """入力欄に message を入れる。bulk は一括挿入後に内容を照合し、不一致なら send_keys で入れ直す。"""
+    with RUN.span("message.input", mode=INPUT_MODE, chars=len(message)) as sp:
+        editor.click()
+        if INPUT_MODE == "bulk":
+            typed = driver.execute_script(_BULK_INSERT_JS, editor, message) or ""
+            if _normalize_editor_text(typed) == _normalize_editor_text(message):
+                logger.info("メッセージを一括入力しました（%d文字）", len(message))
+                return
+            logger.warning("一括入力の内容が一致しません → send_keys で入力し直します")
+            driver.execute_script(_BULK_INSERT_JS, editor, "")
+            sp["fallback"] = "keys"
+        editor.send_keys(message)
+
+
+ROOM_ITEM_SELECTORS = [
+    (By.CSS_SELECTOR, "li[data-role='channel-item']"),
+    (By.CSS_SELECTOR, "li[data-qa*='channel']"),
+]
+
+
+# チャンネル一覧を1回の execute_script で走査し、一致した li とチャンネルIDを返す
+_FIND_ROOM_JS = """
+const name = arguments[0], selector = arguments[1];
+for (const li of document.querySelectorAll(selector)) {
+  if ((li.innerText || "").includes(name)) {
+    const id = li.getAttribute("data-channel-no") || li.getAttribute("data-channel-id")
+      || li.getAttribute("data-id") || "";
+    return [li, id];
+  }
+}
+return null;
+"""
+
+
+def _open_room_direct(driver: webdriver.Chrome, room_name: str, cache: LocatorCache) -> bool:
+    """キャッシュ済みの直リンクでルームを開く。開けなければキャッシュを破棄して False。"""
+    cached = cache.room(room_name)
+    if not cached:
+        return False
+    logger.info("%sルームを直リンクで開いています: %s", room_name, cached["url"])
+    driver.get(cached["url"])
+    try:
+        WebDriverWait(driver, STEP_TIMEOUT_SEC["room_direct"]).until(
+            lambda d: d.find_elements(By.CSS_SELECTOR, "div.editor_input.message-input")
+            and cached["channel_id"] in d.current_url
+        )
+        return True
+    except TimeoutException:
+        logger.warning("直リンクで開けませんでした → チャンネル一覧から探します")
+        cache.forget_room(room_name)
+        driver.get(TALK_URL)
+        wait_talk_app_ready(driver)
+        return False
+
+
+def open_room(driver: webdriver.Chrome, room_name: str, cache: LocatorCache | None = None) -> bool:
+    if cache and cache.room(room_name):
+        with RUN.span("room.direct") as sp:
+            sp["hit"] = _open_room_direct(driver, room_name, cache)
+        if sp["hit"]:
+            return True
+
+    logger.info("%sルームを探しています...", room_name)
+    for attempt in range(1, 4):
+        with RUN.span("room.search", attempt=attempt) as sp:
+            _, i = find_first(driver, ROOM_ITEM_SELECTORS, STEP_TIMEOUT_SEC["room_list"],
+                              cache=cache, step="room_list")
+            found = driver.execute_script(_FIND_ROOM_JS, room_name, ROOM_ITEM_SELECTORS[i][1])
+            sp["found"] = bool(found)
+        if found:
+            room, channel_id = found
+            logger.info("%sルームが見つかりました（試行 %d/3）。クリックしています...", room_name, attempt)
+            before = driver.current_url
+            room.click()
+            if cache:
+                _remember_room(driver, room_name, channel_id, before, cache)
+            return True
+        logger.info("ルーム検索試行 %d/3: 一致するルームがありません", attempt)
+        time.sleep(2)
+    return False
+
+
+def _remember_room(driver: webdriver.Chrome, room_name: str, channel_id: str,
+                   before: str, cache: LocatorCache) -> None:
+    """クリック後の URL がルーム固有に変わったら、直リンクとして記録する。
+
+    記録は次回以降の近道にすぎないので、短く待って変わらなければ黙って諦める。
+    """
+    try:
+        WebDriverWait(driver, STEP_TIMEOUT_SEC["room_url"], poll_frequency=0.1).until(
+            lambda d: d.current_url != before)
+    except WebDriverException:  # TimeoutException を含む
+        return
+    url = driver.current_url
+    key = channel_id if channel_id and channel_id in url else url.rsplit("/", 1)[-1]
+    if key:
+        cache.record_room(room_name, key, url)
+        logger.info("%sルームの直リンクを記録しました: %s", room_name, url)
+
+
+# ─────────── Poster 実装 ─────────── #
+class SeleniumPoster(Poster):
+    """UI 操作で投稿する。open() でログイン〜ルーム選択、send() で入力〜送信。
+
+    room_name が空なら open() はログインまで。複数ルームへは select_room() → send() を繰り返す。
+    profile_dir / debugger_address を省略すると CHROME_PROFILE_DIR / CHROME_DEBUGGER_ADDRESS を使う。
+    cache を渡すと複数セッションで LocatorCache を共有する（省略時は自前で読み込む）。
+    label（fanout のアカウント名）を付けると、ログイン経路は実行全体の属性ではなく
+    self.login_path にだけ残し、失敗時のダンプもファイル名にラベルを入れて分ける。
+    """
+
+    name = "selenium"
+
+    def __init__(self, room_name: str, lw_id: str | None = None, lw_pass: str | None = None,
+                 profile_dir: str | None = None, debugger_address: str | None = None,
+                 cache: LocatorCache | None = None, label: str = ""):
+        self.room_name = room_name
+        self.lw_id = lw_id if lw_id is not None else os.getenv("LINEWORKS_ID", "")
+        self.lw_pass = lw_pass if lw_pass is not None else os.getenv("LINEWORKS_PASS", "")
+        self.profile_dir = profile_dir if profile_dir is not None else CHROME_PROFILE_DIR
+        self.debugger_address = debugger_address if debugger_address is not None else CHROME_DEBUGGER_ADDRESS
+        self.driver: webdriver.Chrome | None = None
+        self.cache = cache or LocatorCache()
+        self.label = label
+        self.login_path = ""
+        self._t_login = 0.0
+
+    def _set_login_path(self, path: str) -> None:
+        self.login_path = path
+        if not self.label:
+            RUN.set(login_path=path)
+
+    def check_config(self) -> None:
+        if not self.lw_id or not self.lw_pass:
+            raise RuntimeError("環境変数 LINEWORKS_ID / LINEWORKS_PASS を設定してください（.env 推奨）")
+
+    def open(self) -> None:
+        self.check_config()
+        logger.info("ブラウザを起動しています...")
+        logger.info("=== ENV CHROMEDRIVER_PATH: %s", CHROMEDRIVER_PATH or "(auto)")
+        logger.info("=== ENV CHROME_BINARY: %s", CHROME_BINARY or "(default)")
+        with RUN.span("driver.connect") as sp:
+            self.driver, attached = connect_driver(self.debugger_address, self.profile_dir)
+            sp["attached"] = attached
+        driver = self.driver
+
+        # 1)〜4) ログイン（プロファイル再利用時はセッション確認のみ）
+        self._t_login = time.perf_counter()
+        if attached and session_is_valid(driver):
+            logger.info("ログイン経路: session（常駐ブラウザ %s を再利用）", self.debugger_address)
+            self._set_login_path("session")
+        elif not attached and self.profile_dir and session_is_valid(driver):
+            logger.info("ログイン経路: session（保存済みプロファイル %s を再利用）", self.profile_dir)
+            self._set_login_path("session")
+        else:
+            login_with_credentials(driver, self.lw_id, self.lw_pass, self.cache)
+            logger.info("ログイン経路: credentials")
+            self._set_login_path("credentials")
+
+        # 5) チャンネル選択
+        if self.room_name:
+            self.select_room(self.room_name)
+
+    def select_room(self, room_name: str) -> None:
+        with RUN.span("room.open"):
+            if not open_room(self.driver, room_name, self.cache):
+                raise TimeoutException(f"チャンネル {room_name} をUIから選択できませんでした")
+        self.room_name = room_name
+
+    def send(self, message: str) -> None:
+        # 6) 投稿
+        driver = self.driver
+        logger.info("メッセージ入力欄を探しています...")
+        with RUN.span("editor.ready"):
+            editor = _find_first(driver, "editor", [(By.CSS_SELECTOR, "div.editor_input.message-input")],
+                                 self.cache)
+        logger.info("メッセージ入力欄が見つかりました: div.editor_input.message-input")
+        if self._t_login:
+            logger.info("[timing] login→editor ready: %.1fs (lean=%s)",
+                        time.perf_counter() - self._t_login, "on" if LEAN_PAGE_LOAD else "off")
+            self._t_login = 0.0
+        logger.info("メッセージを入力しています...")
+        input_message(driver, editor, message)
+
+        logger.info("Ctrl+Enterでメッセージを送信しています...")
+        with RUN.span("message.send") as sp:
+            ActionChains(driver).key_down(Keys.CONTROL).send_keys(Keys.ENTER).key_up(Keys.CONTROL).perform()
+
+            try:
+                WebDriverWait(driver, 10).until(EC.staleness_of(editor))
+                sp["confirmed"] = True
+            except TimeoutException:
+                sp["confirmed"] = False
+
+    def close(self, exc: BaseException | None = None) -> None:
+        if exc is not None and not isinstance(exc, KeyboardInterrupt) and self.driver:
+            # デバッグ用ダンプ
+            try:
+                suffix = "_" + re.sub(r"[^\w.-]", "_", self.label) if self.label else ""
+                stem = f"/tmp/cred_error{suffix}"
+                png = f"{stem}.png"
+                html = f"{stem}.html"
+                self.driver.save_screenshot(png)
+                Path(html).write_text(self.driver.page_source, encoding="utf-8")
+                logger.error("デバッグ用に %s と %s を保存しました", png, html)
+            except Exception:
+                pass
+        self.cache.save()
+        # 常駐ブラウザ接続時の quit() は chromedriver セッションを閉じるだけで、Chrome 本体は残る
+        try:
+            if self.driver:
+                self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
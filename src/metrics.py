@@ -0,0 +1,179 @@
+"""
+metrics.py – 実行ごとのフェーズ計測（span）と記録
+
+    from metrics import RUN
+    with RUN.span("driver.connect") as sp:
+        ...
+        sp["attached"] = True      # 任意の属性を付けられる
+
+実行の最後に RUN.write() で
+- cron_logs/metrics.jsonl に1実行1行の JSON を追記（METRICS_JSONL で変更可）
+- cron_logs/lineworks_cred.prom に Prometheus textfile 形式の要約を書き出す
+  （METRICS_PROM で node_exporter の textfile collector のディレクトリを指定）
+METRICS=0 で記録しない。
+
+`python src/metrics.py --days 28` で、フェーズごとの p50 / p95 / max を集計表示する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_JSONL = PROJECT_ROOT / "cron_logs" / "metrics.jsonl"
+DEFAULT_PROM = PROJECT_ROOT / "cron_logs" / "lineworks_cred.prom"
+PROM_PREFIX = "lineworks_cred"
+
+logger = logging.getLogger(__name__)
+
+
+class RunMetrics:
+    """1回の実行で計測した span と実行属性を保持する（スレッドから同時に記録してよい）。"""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: list[dict] = []
+        self.attrs: dict = {}
+
+    def set(self, **attrs) -> None:
+        with self._lock:
+            self.attrs.update(attrs)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        rec = {"name": name, "start_sec": round(time.perf_counter() - self._t0, 3), **attrs}
+        t0 = time.perf_counter()
+        try:
+            yield rec
+            rec["ok"] = True
+        except BaseException as e:
+            rec["ok"] = False
+            rec["error"] = type(e).__name__
+            raise
+        finally:
+            rec["sec"] = round(time.perf_counter() - t0, 3)
+            with self._lock:
+                self.spans.append(rec)
+
+    def phase_totals(self) -> dict[str, dict]:
+        """同名 span の合計秒と回数。"""
+        totals: dict[str, dict] = {}
+        with self._lock:
+            for sp in self.spans:
+                t = totals.setdefault(sp["name"], {"sec": 0.0, "count": 0})
+                t["sec"] = round(t["sec"] + sp["sec"], 3)
+                t["count"] += 1
+        return totals
+
+    def record(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+            attrs = dict(self.attrs)
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total_sec": round(time.perf_counter() - self._t0, 3),
+            **attrs,
+            "phases": self.phase_totals(),
+            "spans": spans,
+        }
+
+    def write(self, jsonl_path: Path | str | None = None, prom_path: Path | str | None = None,
+              prom: bool = True) -> dict | None:
+        """JSON 1行を追記し、prom=True なら textfile も更新する。書き込み失敗は実行を止めない。"""
+        if os.getenv("METRICS", "1") == "0":
+            return None
+        rec = self.record()
+        jsonl = Path(jsonl_path or os.getenv("METRICS_JSONL") or DEFAULT_JSONL)
+        try:
+            jsonl.parent.mkdir(parents=True, exist_ok=True)
+            with jsonl.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            if prom:
+                write_prom(rec, Path(prom_path or os.getenv("METRICS_PROM") or DEFAULT_PROM))
+        except OSError as e:
+            logger.warning("メトリクスを書き出せませんでした: %s", e)
+        return rec
+
+
+def write_prom(rec: dict, path: Path) -> None:
+    """直近の実行を gauge として書き出す（一時ファイル経由で置き換え）。"""
+    lines = [
+        f"# HELP {PROM_PREFIX}_phase_seconds Seconds spent per phase in the last run.",
+        f"# TYPE {PROM_PREFIX}_phase_seconds gauge",
+    ]
+    for name, t in sorted(rec["phases"].items()):
+        lines.append(f'{PROM_PREFIX}_phase_seconds{{phase="{name}"}} {t["sec"]}')
+    lines += [
+        f"# HELP {PROM_PREFIX}_phase_count Number of spans per phase in the last run.",
+        f"# TYPE {PROM_PREFIX}_phase_count gauge",
+    ]
+    for name, t in sorted(rec["phases"].items()):
+        lines.append(f'{PROM_PREFIX}_phase_count{{phase="{name}"}} {t["count"]}')
+    eval_tokens = sum(sp.get("eval_count", 0) for sp in rec["spans"])
+    lines += [
+        f"# HELP {PROM_PREFIX}_run_seconds Wall time of the last run.",
+        f"# TYPE {PROM_PREFIX}_run_seconds gauge",
+        f"{PROM_PREFIX}_run_seconds {rec['total_sec']}",
+        f"# HELP {PROM_PREFIX}_run_success 1 if the last run posted or skipped normally.",
+        f"# TYPE {PROM_PREFIX}_run_success gauge",
+        f"{PROM_PREFIX}_run_success {1 if rec.get('outcome') in ('sent', 'skipped') else 0}",
+        f"# HELP {PROM_PREFIX}_llm_eval_tokens Tokens generated by the LLM in the last run.",
+        f"# TYPE {PROM_PREFIX}_llm_eval_tokens gauge",
+        f"{PROM_PREFIX}_llm_eval_tokens {eval_tokens}",
+        f"# HELP {PROM_PREFIX}_last_run_timestamp_seconds Start time of the last run.",
+        f"# TYPE {PROM_PREFIX}_last_run_timestamp_seconds gauge",
+        f"{PROM_PREFIX}_last_run_timestamp_seconds "
+        f"{int(datetime.fromisoformat(rec['started_at']).timestamp())}",
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# プロセス内で共有する計測（各モジュールはこれに span を記録する）
+RUN = RunMetrics()
+
+
+# ─────────── 集計 ─────────── #
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(path: Path, days: int, modes: set[str]) -> None:
+    since = datetime.now() - timedelta(days=days)
+    per_phase: dict[str, list[float]] = {}
+    runs = 0
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec.get("mode") not in modes or datetime.fromisoformat(rec["started_at"]) < since:
+                continue
+            runs += 1
+            per_phase.setdefault("(total)", []).append(rec["total_sec"])
+            for name, t in rec.get("phases", {}).items():
+                per_phase.setdefault(name, []).append(t["sec"])
+    print(f"runs={runs}（直近 {days} 日, mode={','.join(sorted(modes))}）")
+    for name, vals in sorted(per_phase.items()):
+        print(f"{name:<24} n={len(vals):4d} p50={_pct(vals, 0.5):7.2f}s "
+              f"p95={_pct(vals, 0.95):7.2f}s max={max(vals):7.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="metrics.jsonl をフェーズ別に集計")
+    parser.add_argument("--file", default=os.getenv("METRICS_JSONL") or str(DEFAULT_JSONL))
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--mode", default="post,pipeline", help="集計する実行モード（カンマ区切り）")
+    a = parser.parse_args()
+    summarize(Path(a.file), a.days, {m.strip() for m in a.mode.split(",") if m.strip()})
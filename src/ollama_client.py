@@ -0,0 +1,126 @@
+"""
+ollama_client.py – Ollama HTTP API クライアント
+
+- requests.Session のコネクションプールで keep-alive 接続を再利用
+- keep_alive（既定 OLLAMA_KEEP_ALIVE=10m）でモデルをメモリに常駐させる
+- warmup() でモデルを先読みし、本番の1回目がロード時間を払わないようにする
+- 応答の load_duration / prompt_eval_duration / eval_duration をログに分けて出す
+- generate_stream() は逐次受信し、stop_when が真になった時点で接続を閉じて打ち切る
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+_NS = 1e9
+
+
+def ollama_stats(data: dict) -> dict:
+    """応答の計測値（ナノ秒）を秒に直して返す。"""
+    eval_count = data.get("eval_count", 0)
+    eval_sec = data.get("eval_duration", 0) / _NS
+    return {
+        "load_sec": data.get("load_duration", 0) / _NS,
+        "prompt_eval_sec": data.get("prompt_eval_duration", 0) / _NS,
+        "prompt_eval_count": data.get("prompt_eval_count", 0),
+        "eval_sec": eval_sec,
+        "eval_count": eval_count,
+        "tokens_per_sec": eval_count / eval_sec if eval_sec else 0.0,
+        "total_sec": data.get("total_duration", 0) / _NS,
+    }
+
+
+def _log_stats(label: str, data: dict) -> None:
+    st = ollama_stats(data)
+    logger.info(
+        "ollama %s: load=%.2fs prompt_eval=%.2fs(%d tok) eval=%.2fs(%d tok, %.1f tok/s) total=%.2fs",
+        label, st["load_sec"], st["prompt_eval_sec"], st["prompt_eval_count"],
+        st["eval_sec"], st["eval_count"], st["tokens_per_sec"], st["total_sec"],
+    )
+
+
+class OllamaClient:
+    """1つのモデルに対する /api/generate 呼び出しをまとめる。"""
+
+    def __init__(self, host: str, model: str, keep_alive: str = "10m",
+                 timeout: float = 120, pool_size: int = 4):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _post(self, payload: dict, **kw) -> requests.Response:
+        r = self.session.post(f"{self.host}/api/generate",
+                              json={"model": self.model, "keep_alive": self.keep_alive, **payload},
+                              timeout=self.timeout, **kw)
+        r.raise_for_status()
+        return r
+
+    def generate(self, prompt: str, options: dict | None = None, **extra) -> dict:
+        """非ストリーミングで生成し、応答 JSON 全体を返す（本文は ["response"]）。"""
+        data = self._post({"prompt": prompt, "options": options or {}, "stream": False, **extra}).json()
+        _log_stats("generate", data)
+        return data
+
+    def generate_stream(self, prompt: str, options: dict | None = None,
+                        stop_when: Callable[[str], bool] | None = None, **extra) -> dict:
+        """ストリーミングで生成する。stop_when(累積テキスト) が真になったら打ち切る。
+
+        戻り値は {"response", "early_stop", "chunks", "first_token_sec", "elapsed_sec", "stats"}。
+        stats は最後まで受信したときの ollama_stats()（打ち切り時は空）。
+        打ち切り時は応答を閉じ、Ollama 側の生成もキャンセルさせる。
+        """
+        t0 = time.perf_counter()
+        r = self._post({"prompt": prompt, "options": options or {}, "stream": True, **extra}, stream=True)
+        text, chunks, first, early, last = "", 0, 0.0, False, {}
+        try:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                last = json.loads(line)
+                piece = last.get("response", "")
+                if piece:
+                    chunks += 1
+                    first = first or time.perf_counter() - t0
+                    text += piece
+                    if stop_when and stop_when(text):
+                        early = True
+                        break
+                if last.get("done"):
+                    break
+        finally:
+            r.close()
+        if last.get("done"):
+            _log_stats("generate(stream)", last)
+        return {
+            "response": text,
+            "early_stop": early,
+            "chunks": chunks,
+            "first_token_sec": first,
+            "elapsed_sec": time.perf_counter() - t0,
+            "stats": ollama_stats(last) if last.get("done") else {},
+        }
+
+    def warmup(self) -> float:
+        """プロンプト無しの generate でモデルだけをロードし、所要秒を返す。"""
+        t0 = time.perf_counter()
+        data = self._post({"stream": False}).json()
+        elapsed = time.perf_counter() - t0
+        logger.info("ollama warmup: %s をロードしました（load=%.2fs, 往復 %.2fs, keep_alive=%s）",
+                    self.model, data.get("load_duration", 0) / _NS, elapsed, self.keep_alive)
+        return elapsed
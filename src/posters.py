@@ -0,0 +1,56 @@
+"""
+posters.py – 投稿バックエンドの共通インタフェース
+
+- selenium: Headless Chrome で UI を操作（lw_selenium.SeleniumPoster）
+- bot:      LINE WORKS Bot API で直接送信（lw_botapi.BotApiPoster）
+
+バックエンドは使うときに import するため、bot 利用時は Selenium を読み込まない。
+
+    with make_poster("bot", room_name=ROOM_NAME) as poster:
+        poster.send(message)
+"""
+
+from __future__ import annotations
+
+POSTER_KINDS = ("selenium", "bot")
+
+
+class Poster:
+    """open() で送信準備（ログイン等）、send() で1件送信、close() で後始末。"""
+
+    name = "base"
+
+    def check_config(self) -> None:
+        """必要な設定が揃っているか確認する。不足時は RuntimeError。"""
+
+    def open(self) -> None:
+        pass
+
+    def send(self, message: str) -> None:
+        raise NotImplementedError
+
+    def close(self, exc: BaseException | None = None) -> None:
+        pass
+
+    def __enter__(self) -> "Poster":
+        try:
+            self.open()
+        except BaseException as e:
+            self.close(e)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close(exc)
+        return False
+
+
+def make_poster(kind: str, room_name: str) -> Poster:
+    """POSTER 種別からバックエンドを生成する。"""
+    if kind == "selenium":
+        from lw_selenium import SeleniumPoster
+        return SeleniumPoster(room_name)
+    if kind == "bot":
+        from lw_botapi import BotApiPoster
+        return BotApiPoster.from_env()
+    raise ValueError(f"未知の POSTER です: {kind}（{' / '.join(POSTER_KINDS)}）")
@@ -0,0 +1,69 @@
+"""
+pregen_store.py – 事前生成した「気づき」本文の保存先（SQLite）
+
+夜間などに `lineworks_cred_llm.py --pregenerate N` で今後 N 営業日分を生成して保存し、
+17:35 の本番はその日の分を読むだけにする。無ければ従来どおりその場で生成する。
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from datetime import date
+from pathlib import Path
+
+DEFAULT_STORE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "pregenerated.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    day        TEXT PRIMARY KEY,   -- YYYY-MM-DD（投稿予定日）
+    idx        INTEGER NOT NULL,
+    title      TEXT NOT NULL,
+    body       TEXT NOT NULL,
+    model      TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class PregenStore:
+    """投稿予定日 → (クレド番号, タイトル, 本文) を保持する。"""
+
+    def __init__(self, path: Path | str = DEFAULT_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def put(self, day: date, idx: int, title: str, body: str, model: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO messages (day, idx, title, body, model, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (day.isoformat(), idx, title, body, model, time.time()),
+            )
+
+    def get(self, day: date) -> tuple[int, str, str] | None:
+        row = self.conn.execute(
+            "SELECT idx, title, body FROM messages WHERE day = ?", (day.isoformat(),)
+        ).fetchone()
+        return (row[0], row[1], row[2]) if row else None
+
+    def delete(self, day: date) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM messages WHERE day = ?", (day.isoformat(),))
+
+    def days(self) -> list[date]:
+        rows = self.conn.execute("SELECT day FROM messages ORDER BY day").fetchall()
+        return [date.fromisoformat(r[0]) for r in rows]
+
+    def prune(self, before: date) -> int:
+        """before より前（投稿されずに過ぎた日）の分を削除し、件数を返す。"""
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM messages WHERE day < ?", (before.isoformat(),))
+        return cur.rowcount
@@ -8,6 +8,12 @@ USAGE:
   2) 任意のスクリプトを明示:
        ./run_if_business_day.py path/to/script.py [args...]
 
+実行方法:
+- 既定（RUN_MODE=auto）は、このインタプリタがターゲットの想定する Python と同じなら
+  runpy で同一プロセス内に実行する（.env・jpholiday を読み直さず、起動1回分を省く）
+- プロジェクトの .venv があり、いまの Python がその .venv でない場合だけ subprocess で起動
+- RUN_MODE=subprocess で常に subprocess
+
 除外日の指定方法:
 - .env に SKIP_DATES="2025-08-15, 12-31" のようにカンマ/空白区切りで列挙
   * YYYY-MM-DD 形式はその年のピンポイント除外
@@ -18,64 +24,55 @@ USAGE:
 
 import datetime as dt
 import os
-import re
+import runpy
 import sys
 import subprocess
+import traceback
 from pathlib import Path
 
-import jpholiday
 from dotenv import load_dotenv
 
+# 投稿日カレンダーは src/business_calendar.py（src 直下のコピーからはそのまま import できる）
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src"))
+from business_calendar import calendar_for  # noqa: E402
+
 
 def is_business(day: dt.date) -> bool:
     """月〜金かつ祝日でないかを判定する。"""
-    return day.weekday() < 5 and not jpholiday.is_holiday(day)
-
-
-def parse_tokens(s: str):
-    """SKIP_DATES などの文字列をパースして、日付集合を返す。"""
-    full_dates: set[dt.date] = set()        # YYYY-MM-DD 固定日
-    recur_md: set[tuple[int, int]] = set()  # (MM,DD) 毎年
-    if not s:
-        return full_dates, recur_md
-    for tok in re.split(r"[,\s]+", s.strip()):
-        if not tok:
-            continue
-        if re.fullmatch(r"\d{4}-\d{2}-\d{2}", tok):
-            y, m, d = map(int, tok.split("-"))
-            full_dates.add(dt.date(y, m, d))
-        elif re.fullmatch(r"\d{2}-\d{2}", tok):
-            m, d = map(int, tok.split("-"))
-            recur_md.add((m, d))
-        else:
-            # 不正フォーマットは黙って無視
-            pass
-    return full_dates, recur_md
-
-
-def load_skip_dates(base: Path):
-    """環境変数とファイルから除外日を読み込む。"""
-    full_dates: set[dt.date] = set()
-    recur_md: set[tuple[int, int]] = set()
-
-    # 1) 環境変数 SKIP_DATES
-    f1, r1 = parse_tokens(os.environ.get("SKIP_DATES", ""))
-    full_dates |= f1
-    recur_md |= r1
-
-    # 2) ファイル（デフォルトは ./skip_dates.txt）
-    file_path = os.environ.get("SKIP_DATES_FILE") or str(base / "skip_dates.txt")
-    p = Path(file_path)
-    if p.exists():
-        for raw in p.read_text(encoding="utf-8").splitlines():
-            line = raw.split("#", 1)[0].strip()
-            if not line:
-                continue
-            f2, r2 = parse_tokens(line)
-            full_dates |= f2
-            recur_md   |= r2
-
-    return full_dates, recur_md
+    return calendar_for(Path(__file__).resolve().parent).is_business(day)
+
+
+def run_in_process(target: Path, args: list[str], cwd: Path) -> int:
+    """target を `python target args...` と同じ条件（__main__・sys.path・cwd）でこのプロセス内に実行する。"""
+    saved_argv, saved_path, saved_cwd = sys.argv[:], sys.path[:], os.getcwd()
+    sys.argv = [str(target), *args]
+    sys.path.insert(0, str(target.parent))
+    os.chdir(cwd)
+    try:
+        runpy.run_path(str(target), run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv, sys.path[:] = saved_argv, saved_path
+        os.chdir(saved_cwd)
+
+
+def needs_subprocess(venv_dir: Path) -> bool:
+    """.venv があり、いまの Python がその .venv でなければ別インタプリタが必要。"""
+    if os.environ.get("RUN_MODE", "auto").strip().lower() == "subprocess":
+        return True
+    if not (venv_dir / "bin" / "python").exists():
+        return False
+    return Path(sys.prefix).resolve() != venv_dir.resolve()
 
 
 def main() -> int:
@@ -91,16 +88,12 @@ def main() -> int:
     if env_file.exists():
         load_dotenv(dotenv_path=env_file, override=True)
 
-    # 除外日読み込み
-    full_dates, recur_md = load_skip_dates(script_dir)
-
-    # 指定除外日チェック
-    if (today in full_dates) or ((today.month, today.day) in recur_md):
+    # 指定除外日・平日・祝日チェック（除外日と土日なら祝日表は作らない）
+    reason = calendar_for(script_dir).skip_reason(today)
+    if reason == "skip":
         print(f"[skip] {today} は指定除外日")
         return 0
-
-    # 平日・祝日チェック
-    if not is_business(today):
+    if reason is not None:
         print(f"[skip] {today} は休日/祝日")
         return 0
 
@@ -114,15 +107,19 @@ def main() -> int:
 
     target = (script_dir / target_rel).resolve()
 
-    # 使うPython：プロジェクトの .venv 優先、なければ現在のPython
-    venv_py = script_dir / ".venv" / "bin" / "python"
-    python_bin = venv_py if venv_py.exists() else Path(sys.executable)
-
     if not target.exists():
         print(f"[err] ターゲットが見つかりません: {target}", file=sys.stderr)
         return 2
 
-    print(f"[run] {today} 平日判定 OK → {target.name}")
+    # 使うPython：プロジェクトの .venv 優先。いま動いているのがそれなら同一プロセスで実行
+    venv_dir = script_dir / ".venv"
+    if not needs_subprocess(venv_dir):
+        print(f"[run] {today} 平日判定 OK → {target.name}（in-process）", flush=True)
+        return run_in_process(target, extra_args, script_dir)
+
+    venv_py = venv_dir / "bin" / "python"
+    python_bin = venv_py if venv_py.exists() else Path(sys.executable)
+    print(f"[run] {today} 平日判定 OK → {target.name}（{python_bin}）", flush=True)
     # 実行（作業ディレクトリはプロジェクトルート）
     proc = subprocess.run(
         [str(python_bin), str(target), *extra_args],